@@ -4,17 +4,31 @@ from discord import app_commands
 import aiohttp
 import asyncio
 import random
+import re
+import contextlib
+import abc
 import os
 import uuid
-import wave
 import io
 import time
+import hashlib
+import threading
+import struct
+import heapq
+import itertools
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
 from google import genai
 from google.genai import types
 import yt_dlp
 import json
 import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import pyopenjtalk  # 任意: VOICEVOXが落ちているときの予備の読み上げエンジン
+except ImportError:
+    pyopenjtalk = None
 
 def update_source_volume(source, volume_level):
     """source（またはそのラップ元）からPCMVolumeTransformerを探して音量を変更する"""
@@ -39,6 +53,9 @@ def load_menu_links() -> list[dict]:
 # SETTINGS
 # ==========================================
 VOICEVOX_URL = os.getenv('VOICEVOX_URL', 'http://127.0.0.1:50021')
+# 複数のVOICEVOXエンジンをカンマ区切りで指定できる（例: http://pc:50021,http://raspi:50021）
+VOICEVOX_URLS = [url.strip() for url in os.getenv('VOICEVOX_URLS', VOICEVOX_URL).split(',') if url.strip()]
+VOICEVOX_MAX_CONCURRENCY = int(os.getenv('VOICEVOX_MAX_CONCURRENCY', '2'))  # VOICEVOXへの同時リクエスト数
 SPEAKER_ID = 3
 
 # 話者マップ（on_readyで動的生成）
@@ -54,6 +71,9 @@ DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 USER_VOICES_FILE = os.path.join(DATA_DIR, "user_voices.json")
 BOT_CONFIG_FILE = os.path.join(DATA_DIR, "bot_config.json")
+SPEAKER_CATALOG_FILE = os.path.join(DATA_DIR, "speakers.json")  # 話者一覧のキャッシュ
+SPEAKER_CATALOG_REFRESH_HOURS = 6  # エンジンのバージョンが同じでもこの間隔で /speakers を確認し直す
+TTS_DISK_CACHE_DIR = os.path.join(DATA_DIR, "tts_cache")
 
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN', '')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
@@ -80,13 +100,35 @@ def get_guild_state(guild_id: int):
             "voice_last_audio_time": None,
             "voice_buffer_active": False,
             "rolling_sink": None,
-            "tts_queue": asyncio.Queue(),
+            "tts_queue": asyncio.PriorityQueue(),  # (優先度, 受付順, ジョブ)
+            "tts_worker": None,
+            "tts_backlog": 0,        # キューに入れてまだ再生し終わっていないジョブ数
+            "tts_backlog_seconds": 0.0,  # 未再生ジョブの見積もり秒数
+            "tts_drain": None,       # 現在溜まっているキューの計測
+            "tts_last_drain": None,  # 最後に解消したキューの計測結果
+            "tts_playing": None,     # 再生中のジョブ
+            "tts_stats": {"dropped": 0, "expired": 0, "skipped": 0, "preempted": 0},
+            "tts_latency": {},       # {優先度: [件数, 合計秒, 最大秒]}（キューに入ってから再生開始まで）
+            "readout_batch": [],     # まとめ待ちのチャット読み上げ [(text, speaker), ...]
+            "readout_flush": None,   # まとめ読み上げのタイマー
+            "greet_pending": [],     # 挨拶待ちのVC参加者
+            "greet_task": None,      # 参加者をまとめて挨拶するタスク
         }
     return guild_state[guild_id]
 
 # 音量設定 (初期値)
 TTS_VOLUME = 1.0      # 読み上げ
 MUSIC_VOLUME = 0.2    # 音楽 (20%)
+TTS_OVER_MUSIC = True  # 音楽の再生中も読み上げる（音楽の音量を下げて重ねる）
+
+# 読み上げが溜まったときの早口設定（bot_config.json の "tts_speedup" で上書きできる）
+TTS_SPEEDUP = {
+    "queue_depth": 3,          # 未再生のジョブ数がこれを超えたら早口にし始める
+    "queued_seconds": 10,      # 未再生の音声がこの秒数を超えたら早口にし始める
+    "max_queued_seconds": 40,  # 未再生の音声がこの秒数で最大倍速になる
+    "max_speed": 1.5,          # 最大倍速
+}
+TTS_SECONDS_PER_CHAR = 0.15    # 未再生の音声の長さを見積もるための1文字あたりの秒数
 
 # トリガー設定
 TRIGGER_CHAT = "もちもち、"
@@ -242,6 +284,7 @@ def load_bot_config():
         with open(BOT_CONFIG_FILE, 'r', encoding='utf-8') as f:
             config = json.load(f)
             SPEAKER_ID = config.get("speaker_id", 3)
+            TTS_SPEEDUP.update(config.get("tts_speedup", {}))
         print(f"🔊 もち神さまボイス: {speaker_map_reverse.get(SPEAKER_ID, 'ID=' + str(SPEAKER_ID))}")
     except FileNotFoundError:
         pass
@@ -250,7 +293,11 @@ def load_bot_config():
 
 def save_bot_config():
     with open(BOT_CONFIG_FILE, 'w', encoding='utf-8') as f:
-        json.dump({"speaker_id": SPEAKER_ID, "name": speaker_map_reverse.get(SPEAKER_ID, "不明")}, f, ensure_ascii=False, indent=2)
+        json.dump({
+            "speaker_id": SPEAKER_ID,
+            "name": speaker_map_reverse.get(SPEAKER_ID, "不明"),
+            "tts_speedup": TTS_SPEEDUP,
+        }, f, ensure_ascii=False, indent=2)
 
 def get_user_speaker_id(user_id: str) -> int:
     """ユーザーのマイボイスが設定されていればその speaker_id を、なければグローバル SPEAKER_ID を返す"""
@@ -258,35 +305,113 @@ def get_user_speaker_id(user_id: str) -> int:
         return user_voices[user_id].get("speaker_id", SPEAKER_ID)
     return SPEAKER_ID
 
+speaker_catalog = {}  # {"engine_version": ..., "etag": ..., "checked_at": ..., "speakers": [...]}
+
+def build_speaker_maps(speakers: list) -> tuple[dict, dict, dict]:
+    """/speakers の結果から (speaker_map, character_styles, speaker_map_reverse) を作る"""
+    new_map, new_styles, new_reverse = {}, {}, {}
+    for speaker in speakers:
+        char_name = speaker['name']
+        styles = []
+        for style in speaker['styles']:
+            style_name = style['name']
+            style_id = style['id']
+            full_name = f"{char_name} / {style_name}"
+            new_map[full_name] = style_id
+            new_reverse[style_id] = full_name
+            styles.append({"name": style_name, "id": style_id})
+        new_styles[char_name] = styles
+    return new_map, new_styles, new_reverse
+
+def apply_speaker_catalog(catalog: dict):
+    """話者一覧から3つの辞書を作り直し、まとめて差し替える（作っている途中の辞書は見せない）"""
+    global speaker_catalog, speaker_map, character_styles, speaker_map_reverse
+    maps = build_speaker_maps(catalog["speakers"])
+    speaker_catalog = catalog
+    speaker_map, character_styles, speaker_map_reverse = maps
+
+def load_speaker_catalog():
+    """前回保存した話者一覧を読み込む（VOICEVOXを待たずにすぐ使える）"""
+    try:
+        with open(SPEAKER_CATALOG_FILE, 'r', encoding='utf-8') as f:
+            apply_speaker_catalog(json.load(f))
+        print(f"🔊 保存済みの話者一覧を読み込みました ({len(character_styles)}キャラ, {len(speaker_map)}スタイル, "
+              f"VOICEVOX {speaker_catalog.get('engine_version')})")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ speakers.json 読込エラー: {e}")
+
+def save_speaker_catalog():
+    tmp_path = SPEAKER_CATALOG_FILE + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(speaker_catalog, f, ensure_ascii=False)
+    os.replace(tmp_path, SPEAKER_CATALOG_FILE)
+
 async def fetch_speakers():
-    """VOICEVOXの /speakers エンドポイントから話者一覧を取得し、辞書を生成する"""
-    global speaker_map, character_styles, speaker_map_reverse
+    """VOICEVOXの話者一覧を確認し、変わっていれば辞書を作り直して保存する
+
+    エンジンのバージョンが保存済みの一覧と同じで、前回の確認から SPEAKER_CATALOG_REFRESH_HOURS 経っていなければ
+    /speakers は取得しない。取得するときも ETag があれば If-None-Match で問い合わせる。
+    """
+    result = await voicevox_pool.request(_fetch_speakers_on)
+    if result is None:
+        print("⚠️ VOICEVOX話者一覧の取得に失敗")
+        return
+    engine_version, speakers, etag = result
+
+    # エンジンのバージョンが変わっていたら音声キャッシュを作り直す
+    cache_cleared = bool(engine_version) and tts_disk_cache.check_engine_version(engine_version)
+    if cache_cleared:
+        tts_cache.clear()
+        tts_opus_cache.clear()
+        tts_play_counts.clear()
+    # 定型文の事前合成はキャッシュが使えるか確かめてから始める（初回と、キャッシュを破棄したとき）
+    if cache_cleared or tts_prewarm_task is None:
+        start_tts_prewarm()
+
     try:
-        async with http_session.get(f'{VOICEVOX_URL}/speakers') as resp:
-            if resp.status != 200:
-                print(f"⚠️ VOICEVOX /speakers 取得失敗: {resp.status}")
-                return
-            speakers = await resp.json()
-        
-        speaker_map = {}
-        character_styles = {}
-        speaker_map_reverse = {}
-        
-        for speaker in speakers:
-            char_name = speaker['name']
-            styles = []
-            for style in speaker['styles']:
-                style_name = style['name']
-                style_id = style['id']
-                full_name = f"{char_name} / {style_name}"
-                speaker_map[full_name] = style_id
-                speaker_map_reverse[style_id] = full_name
-                styles.append({"name": style_name, "id": style_id})
-            character_styles[char_name] = styles
-        
-        print(f"🔊 VOICEVOX話者一覧を取得しました ({len(character_styles)}キャラ, {len(speaker_map)}スタイル)")
+        catalog = {"engine_version": engine_version, "etag": etag, "checked_at": time.time(),
+                   "speakers": speaker_catalog.get("speakers", []) if speakers is None else speakers}
+        changed = speakers is not None and speakers != speaker_catalog.get("speakers")
+        if changed:
+            apply_speaker_catalog(catalog)
+            print(f"🔊 VOICEVOX話者一覧を更新しました ({len(character_styles)}キャラ, {len(speaker_map)}スタイル)")
+        else:
+            speaker_catalog.update(catalog)
+        save_speaker_catalog()
     except Exception as e:
         print(f"⚠️ VOICEVOX話者一覧の取得に失敗: {e}")
+        return
+    # 声選びの試聴用サンプルを用意しておく（キャッシュ済みのスタイルは飛ばす）
+    start_voice_previews()
+
+async def _fetch_speakers_on(engine):
+    """指定エンジンから (バージョン, 話者一覧, ETag) を取得する（話者一覧が変わっていなければ None）"""
+    engine_version = None
+    async with http_session.get(f'{engine.url}/version', timeout=VOICEVOX_PROBE_TIMEOUT) as resp:
+        if resp.status == 200:
+            engine_version = str(await resp.json())
+
+    cached = speaker_catalog
+    if (cached.get("speakers") and engine_version and cached.get("engine_version") == engine_version
+            and time.time() - cached.get("checked_at", 0) < SPEAKER_CATALOG_REFRESH_HOURS * 3600):
+        return engine_version, None, cached.get("etag")
+
+    headers = {}
+    if cached.get("speakers") and cached.get("etag") and cached.get("engine_version") == engine_version:
+        headers["If-None-Match"] = cached["etag"]
+    async with http_session.get(f'{engine.url}/speakers', headers=headers, timeout=VOICEVOX_REQUEST_TIMEOUT) as resp:
+        if resp.status == 304:
+            return engine_version, None, cached.get("etag")
+        if resp.status != 200:
+            print(f"⚠️ VOICEVOX /speakers 取得失敗: {resp.status} ({engine.url})")
+            return None
+        return engine_version, await resp.json(), resp.headers.get("ETag")
+
+@tasks.loop(hours=1)
+async def speaker_catalog_task():
+    await fetch_speakers()
 
 # ==========================================
 # BOT FUNCTIONS
@@ -301,81 +426,1423 @@ bot = commands.Bot(command_prefix='!', intents=intents)
 # HTTPセッション（BOT起動時に初期化）
 http_session: aiohttp.ClientSession = None
 
-async def generate_wav(text, speaker=3):
-    """VOICEVOXでテキストからWAVを生成し、io.BytesIOで返す"""
-    clean_text = text.replace("🔮", "").replace("**", "").replace("【", "").replace("】", "").replace("\n", "。")
+# ==========================================
+# VOICEVOX ENGINE POOL
+# ==========================================
+VOICEVOX_HEALTH_INTERVAL = 30         # ヘルスチェック間隔（秒）
+VOICEVOX_BREAKER_FAILURES = 3         # この回数連続で失敗したら一時的に切り離す
+VOICEVOX_BREAKER_SECONDS = 60         # 切り離しておく秒数
+VOICEVOX_HEDGE_DEFAULT_SECONDS = 2.0  # 遅延統計が少ないうちのヘッジ待ち時間
+VOICEVOX_HEDGE_MIN_SECONDS = 0.3      # ヘッジ待ち時間の下限
+VOICEVOX_PROBE_TIMEOUT = aiohttp.ClientTimeout(total=3)
+VOICEVOX_REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
+class VoicevoxEngine:
+    """VOICEVOXエンジン1台分の状態（同時リクエスト数・直近の遅延・サーキットブレーカー）"""
+    def __init__(self, url):
+        self.url = url
+        self.inflight = 0
+        self.latencies = deque(maxlen=50)  # 直近の成功リクエストにかかった秒数
+        self.failures = 0                  # 連続失敗回数
+        self.open_until = 0.0              # この時刻まで切り離し中
+        self.version = None
+
+    @property
+    def available(self) -> bool:
+        return time.time() >= self.open_until
+
+    def mean_latency(self) -> float:
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+    def p90_latency(self):
+        if len(self.latencies) < 5:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.9) - 1]
+
+    def record_success(self, elapsed=None):
+        if elapsed is not None:
+            self.latencies.append(elapsed)
+        if self.open_until:
+            print(f"🟢 VOICEVOX復帰: {self.url}")
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= VOICEVOX_BREAKER_FAILURES and self.available:
+            print(f"🔴 VOICEVOX切り離し ({VOICEVOX_BREAKER_SECONDS}秒): {self.url}")
+            self.open_until = time.time() + VOICEVOX_BREAKER_SECONDS
+
+class VoicevoxPool:
+    """複数のVOICEVOXエンジンに負荷分散するプール
+
+    同時リクエスト数が少なく直近の遅延が小さいエンジンに送り、
+    p90遅延を超えても返ってこなければ2台目にも同じリクエストを送って早い方を使う。
+    ヘッジしたリクエストも VOICEVOX_MAX_CONCURRENCY に数える（空きがなければヘッジしない）。
+    """
+    def __init__(self, urls):
+        self.engines = [VoicevoxEngine(url) for url in urls]
+
+    def ranked(self) -> list:
+        """リクエストを送る順にエンジンを並べる（全台切り離し中なら復帰が近い順）"""
+        engines = [e for e in self.engines if e.available]
+        if not engines:
+            return sorted(self.engines, key=lambda e: e.open_until)
+        return sorted(engines, key=lambda e: (e.inflight, e.mean_latency()))
+
+    async def health_check(self):
+        await asyncio.gather(*(self._probe(e) for e in self.engines))
+
+    async def _probe(self, engine):
+        try:
+            async with http_session.get(f'{engine.url}/version', timeout=VOICEVOX_PROBE_TIMEOUT) as resp:
+                if resp.status != 200:
+                    raise RuntimeError(f"status {resp.status}")
+                engine.version = str(await resp.json())
+            engine.record_success()
+        except Exception as e:
+            if engine.available:
+                print(f"⚠️ VOICEVOXヘルスチェック失敗: {engine.url} ({e})")
+            engine.record_failure()
+
+    async def _run(self, engine, request_fn):
+        engine.inflight += 1
+        started = time.perf_counter()
+        try:
+            result = await request_fn(engine)
+        except Exception as e:
+            print(f"⚠️ VOICEVOXエラー: {e} ({engine.url})")
+            result = None
+        finally:
+            engine.inflight -= 1
+        if result is None:
+            engine.record_failure()
+        else:
+            engine.record_success(time.perf_counter() - started)
+        return result
+
+    async def request(self, request_fn):
+        """request_fn(engine) をエンジンに送り、結果を返す（全台失敗ならNone）"""
+        engines = self.ranked()
+        tasks = set()
+        try:
+            for i, engine in enumerate(engines):
+                task = asyncio.create_task(self._run(engine, request_fn))
+                if tasks:
+                    # ヘッジ分の実行権は終わったら（キャンセルされても）返す
+                    task.add_done_callback(lambda _: voicevox_scheduler.release())
+                tasks.add(task)
+                backup = engines[i + 1] if i + 1 < len(engines) else None
+                hedge_delay = None
+                if backup is not None:
+                    hedge_delay = max(VOICEVOX_HEDGE_MIN_SECONDS, engine.p90_latency() or VOICEVOX_HEDGE_DEFAULT_SECONDS)
+                while tasks:
+                    done, tasks = await asyncio.wait(tasks, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                    if not done:
+                        if voicevox_scheduler.try_acquire():
+                            break  # p90を超えたので次のエンジンにもヘッジする
+                        hedge_delay = None  # 同時リクエスト数が上限なのでヘッジせずに待つ
+                        continue
+                    for task in done:
+                        if task.result() is not None:
+                            return task.result()
+                # 失敗した（またはヘッジする）なら次のエンジンへ
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+
+voicevox_pool = VoicevoxPool(VOICEVOX_URLS)
+
+@tasks.loop(seconds=VOICEVOX_HEALTH_INTERVAL)
+async def voicevox_health_task():
+    await voicevox_pool.health_check()
+
+# ==========================================
+# VOICEVOX SCHEDULER
+# ==========================================
+# 読み上げの優先度（小さいほど優先）
+TTS_PRIORITY_RESPONSE = 0  # AI応答・コマンドへの返事
+TTS_PRIORITY_GAME = 1      # ダイス・ゲーム
+TTS_PRIORITY_GREETING = 2  # 挨拶・独り言
+TTS_PRIORITY_READOUT = 3   # チャット読み上げ
+TTS_PRIORITY_PREWARM = 4   # 事前合成
+TTS_PRIORITY_NAMES = {
+    TTS_PRIORITY_RESPONSE: "応答", TTS_PRIORITY_GAME: "ゲーム", TTS_PRIORITY_GREETING: "挨拶",
+    TTS_PRIORITY_READOUT: "読み上げ", TTS_PRIORITY_PREWARM: "事前合成",
+}
+
+def record_wait(wait_stats: dict, priority, waited: float):
+    """優先度ごとの待ち時間を {優先度: [件数, 合計待ち秒, 最大待ち秒]} に記録する"""
+    stats = wait_stats.setdefault(priority, [0, 0.0, 0.0])
+    stats[0] += 1
+    stats[1] += waited
+    stats[2] = max(stats[2], waited)
+
+def format_wait_stats(wait_stats: dict) -> str:
+    parts = []
+    for priority, (count, total, longest) in sorted(wait_stats.items()):
+        parts.append(f"{TTS_PRIORITY_NAMES.get(priority, priority)} 平均{total / count:.2f}秒/最大{longest:.1f}秒 ({count}件)")
+    return " / ".join(parts) or "まだ記録なし"
+
+class VoicevoxScheduler:
+    """VOICEVOXへの同時リクエスト数を制限し、優先度の高い順・同じ優先度ならギルド間で順番に実行権を渡す"""
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._waiters = {}     # {優先度: OrderedDict{guild_id: deque[Future]}}
+        self.wait_stats = {}   # {優先度: [件数, 合計待ち秒, 最大待ち秒]}
+
+    def try_acquire(self) -> bool:
+        """待たずに実行権が取れるなら取る（返すときは release() を呼ぶ）"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        return False
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority, guild_id=None):
+        queued_at = time.perf_counter()
+        if not self.try_acquire():
+            fut = asyncio.get_running_loop().create_future()
+            guilds = self._waiters.setdefault(priority, OrderedDict())
+            guilds.setdefault(guild_id, deque()).append(fut)
+            try:
+                await fut  # release() から実行権を引き継ぐ
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    self.release()  # 実行権を受け取った直後にキャンセルされた
+                else:
+                    self._discard(priority, guild_id, fut)
+                raise
+        self._record_wait(priority, time.perf_counter() - queued_at)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def release(self):
+        """実行権を次に待っているリクエストに渡す（誰も待っていなければ返す）"""
+        while self._waiters:
+            priority = min(self._waiters)
+            guilds = self._waiters[priority]
+            guild_id, waiters = next(iter(guilds.items()))
+            fut = waiters.popleft()
+            # 同じ優先度の中ではギルドを順番に回す
+            del guilds[guild_id]
+            if waiters:
+                guilds[guild_id] = waiters
+            if not guilds:
+                del self._waiters[priority]
+            # キャンセル済みで、まだ自分を取り除いていない待機者は飛ばす
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+    def _discard(self, priority, guild_id, fut):
+        guilds = self._waiters.get(priority, {})
+        waiters = guilds.get(guild_id)
+        if waiters and fut in waiters:
+            waiters.remove(fut)
+            if not waiters:
+                del guilds[guild_id]
+            if not guilds:
+                del self._waiters[priority]
+
+    def _record_wait(self, priority, waited):
+        record_wait(self.wait_stats, priority, waited)
+        if waited >= 1.0 and priority < TTS_PRIORITY_PREWARM:
+            print(f"⏳ VOICEVOX待ち {waited:.1f}秒 ({TTS_PRIORITY_NAMES.get(priority, priority)})")
+
+    def summary(self) -> str:
+        return format_wait_stats(self.wait_stats)
+
+voicevox_scheduler = VoicevoxScheduler(VOICEVOX_MAX_CONCURRENCY)
+
+# ==========================================
+# TTS CACHE
+# ==========================================
+TTS_CACHE_MAX_BYTES = 64 * 1024 * 1024        # メモリキャッシュの上限（64MB）
+TTS_DISK_CACHE_MAX_BYTES = 512 * 1024 * 1024  # ディスクキャッシュの上限（512MB）
+TTS_DISK_CACHE_MAX_AGE_DAYS = 30              # 最後に使われてからこの日数で削除
+TTS_OPUS_CACHE_MAX_BYTES = 16 * 1024 * 1024   # エンコード済みOpusキャッシュの上限（16MB）
+TTS_OPUS_HOT_PLAYS = 3                        # この回数再生された文はOpusにエンコードして保持する
+
+class TTSCache:
+    """合成済みWAVを (正規化テキスト, 話者ID) をキーに保持するLRUキャッシュ（バイト数上限つき）"""
+    def __init__(self, max_bytes, sizeof=len):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof           # 値のバイト数を返す関数
+        self._entries = OrderedDict()  # {(text, speaker): wav_bytes}
+        self._size = 0
+        self._inflight = {}            # {(text, speaker): asyncio.Future} 合成中のリクエスト
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0             # 合成中のリクエストに相乗りした回数
+
+    def get(self, key):
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        size = self.sizeof(data)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= self.sizeof(old)
+        self._entries[key] = data
+        self._size += size
+        # 上限を超えたら最も古く使われたものから捨てる
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= self.sizeof(evicted)
+
+    async def get_or_create(self, key, factory):
+        """キャッシュにあればそれを返し、なければ factory() で合成する（同一キーの同時リクエストは1回の合成を共有）"""
+        data = self.get(key)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.coalesced += 1
+            return await asyncio.shield(fut)
+
+        self.misses += 1
+        # 合成は別タスクで行う（最初の呼び出し元がキャンセルされても、相乗りした他の呼び出し元には結果を返す）
+        fut = asyncio.ensure_future(self._create(key, factory))
+        self._inflight[key] = fut
+        return await asyncio.shield(fut)
+
+    async def _create(self, key, factory):
+        try:
+            data = await factory()
+            if data:
+                self.put(key, data)
+            return data
+        except Exception as e:
+            print(f"⚠️ 音声合成エラー: {e}")
+            return None
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+    def summary(self) -> str:
+        total = self.hits + self.misses + self.coalesced
+        rate = (self.hits + self.coalesced) / total * 100 if total else 0.0
+        return (f"ヒット {self.hits} / 相乗り {self.coalesced} / ミス {self.misses} "
+                f"(ヒット率 {rate:.0f}%, {len(self._entries)}件, {self._size / 1024 / 1024:.1f}MB)")
+
+class TTSDiskCache:
+    """合成済みWAVを data/tts_cache/ に保存するキャッシュ（再起動しても残る）"""
+    def __init__(self, directory, max_bytes, max_age_seconds):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.version_file = os.path.join(directory, "engine_version.txt")
+        os.makedirs(directory, exist_ok=True)
+        self._index = {}  # {ファイル名: [サイズ, 最終使用時刻]}
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".wav"):
+                st = entry.stat()
+                self._index[entry.name] = [st.st_size, st.st_mtime]
+                self._size += st.st_size
+        self.evict()
+
+    def _filename(self, key) -> str:
+        text, speaker, *extra = key
+        name = ":".join(str(part) for part in (speaker, text, *extra))
+        return hashlib.sha256(name.encode("utf-8")).hexdigest() + ".wav"
+
+    def contains(self, key) -> bool:
+        return self._filename(key) in self._index
+
+    def get(self, key):
+        """キャッシュにあればWAVのbytesを返す
+
+        mmapはマップごとにファイル記述子を持ち、Windowsではファイルを消せなくなるので、
+        メモリキャッシュに載せても問題ないよう読み込んで返す。
+        """
+        name = self._filename(key)
+        if name not in self._index:
+            self.misses += 1
+            return None
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            now = time.time()
+            os.utime(path, (now, now))  # 最終使用時刻を更新（再起動後のLRU判定用）
+            self._index[name][1] = now
+        except (OSError, ValueError) as e:
+            print(f"⚠️ TTSディスクキャッシュ読込エラー: {e}")
+            self._remove(name)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        name = self._filename(key)
+        path = os.path.join(self.directory, name)
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ TTSディスクキャッシュ書込エラー: {e}")
+            return
+        old = self._index.get(name)
+        if old:
+            self._size -= old[0]
+        self._index[name] = [len(data), time.time()]
+        self._size += len(data)
+        self.evict()
+
+    def evict(self):
+        """期限切れのファイルを消し、上限を超えていれば古く使われたものから消す"""
+        cutoff = time.time() - self.max_age_seconds
+        for name, (_, last_used) in list(self._index.items()):
+            if last_used < cutoff:
+                self._remove(name)
+        if self._size > self.max_bytes:
+            for name, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+                if self._size <= self.max_bytes:
+                    break
+                self._remove(name)
+
+    def _remove(self, name):
+        entry = self._index.pop(name, None)
+        if entry:
+            self._size -= entry[0]
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in list(self._index):
+            self._remove(name)
+
+    def check_engine_version(self, version: str) -> bool:
+        """VOICEVOXのバージョンが前回と違えばキャッシュを破棄する（破棄したらTrue）"""
+        try:
+            with open(self.version_file, "r", encoding="utf-8") as f:
+                cached_version = f.read().strip()
+        except FileNotFoundError:
+            cached_version = None
+        if cached_version == version:
+            return False
+        cleared = cached_version is not None and bool(self._index)
+        if cleared:
+            print(f"🔊 VOICEVOXのバージョンが変わったため音声キャッシュを破棄します ({cached_version} → {version})")
+            self.clear()
+        with open(self.version_file, "w", encoding="utf-8") as f:
+            f.write(version)
+        return cleared
+
+    def summary(self) -> str:
+        return (f"ヒット {self.hits} / ミス {self.misses} "
+                f"({len(self._index)}件, {self._size / 1024 / 1024:.1f}MB)")
+
+tts_cache = TTSCache(TTS_CACHE_MAX_BYTES)
+tts_disk_cache = TTSDiskCache(TTS_DISK_CACHE_DIR, TTS_DISK_CACHE_MAX_BYTES, TTS_DISK_CACHE_MAX_AGE_DAYS * 86400)
+# よく再生される文はOpusパケット列のまま持っておき、再生時のエンコードを省く
+tts_opus_cache = TTSCache(TTS_OPUS_CACHE_MAX_BYTES, sizeof=lambda packets: sum(map(len, packets)))
+tts_play_counts = OrderedDict()  # {(text, speaker): 再生回数}（直近1024件）
+
+class AudioBuffer(io.RawIOBase):
+    """bytes や memoryview をコピーせずに読み出すためのファイルライクオブジェクト"""
+    def __init__(self, data):
+        super().__init__()
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), len(self._view) - self._pos)
+        if n <= 0:
+            return 0
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def getbuffer(self):
+        return self._view
+
+# 読み上げ前の正規化ルール（上から順に適用する）
+_TTS_NORMALIZE_RULES = [
+    (re.compile(r"```.*?```", re.DOTALL), "。コード省略。"),
+    (re.compile(r"`([^`\n]*)`"), r"\1"),
+    # URLに使える文字（ASCII）だけを取る: 「https://youtu.be/abcこれ見て」→「URL省略これ見て」
+    (re.compile(r"https?://[!-~]+"), "URL省略"),
+    (re.compile(r"<a?:(\w+):\d+>"), r"\1"),          # カスタム絵文字は名前だけ読む
+    (re.compile(r"<(?:@[!&]?|#)\d+>"), ""),           # 名前を解決できなかったメンション
+    (re.compile(r"\|\||~~|__|\*\*|[🔮【】]"), ""),
+    (re.compile(r"([^\d０-９])\1{3,}"), r"\1\1\1"), # 「wwwww」→「www」（数字はそのまま）
+    (re.compile(r"\s*\n[\s。]*"), "。"),
+    (re.compile(r"。{2,}"), "。"),
+]
+TTS_READOUT_MAX_CHARS = 100          # チャット読み上げ1件あたりの最大文字数
+TTS_READOUT_TRUNCATED = "、以下略"    # 切り詰めたときに読む言葉
+
+def clean_tts_text(text: str) -> str:
+    """読み上げ用にテキストを整形する（キャッシュキーにも使う）"""
+    for pattern, repl in _TTS_NORMALIZE_RULES:
+        text = pattern.sub(repl, text)
+    return text.strip().strip("。")
+
+def resolve_mentions(message) -> str:
+    """メンションを表示名に置き換えたメッセージ本文を返す"""
+    text = message.content
+    for member in message.mentions:
+        text = re.sub(rf"<@!?{member.id}>", member.display_name, text)
+    for role in message.role_mentions:
+        text = text.replace(f"<@&{role.id}>", role.name)
+    for channel in message.channel_mentions:
+        text = text.replace(f"<#{channel.id}>", channel.name)
+    return text
+
+def normalize_readout_text(message) -> str:
+    """チャット読み上げ用にメッセージを正規化し、長すぎれば切り詰める"""
+    text = clean_tts_text(resolve_mentions(message))
+    if len(text) > TTS_READOUT_MAX_CHARS:
+        text = text[:TTS_READOUT_MAX_CHARS] + TTS_READOUT_TRUNCATED
+    return text
+
+def tts_cache_key(text, speaker, speed=1.0) -> tuple:
+    """キャッシュのキー（通常速度なら (テキスト, 話者ID)、早口なら倍速も含める）"""
+    if speed == 1.0:
+        return (clean_tts_text(text), speaker)
+    return (clean_tts_text(text), speaker, speed)
+
+async def generate_wav(text, speaker=3, priority=TTS_PRIORITY_RESPONSE, guild_id=None, speed=1.0):
+    """テキストからWAVを生成し、AudioBufferで返す
+
+    VOICEVOX（メモリ→ディスク→エンジンの順に探す）が間に合わなければ予備のエンジンで合成する。
+    予備のエンジンの音声には fallback=True が付く（キャッシュには載せない）。
+    """
+    key = tts_cache_key(text, speaker, speed)
+    if not key[0]:
+        return None
+    data, backend = await tts_router.synthesize(key, priority, guild_id)
+    if not data:
+        return None
+    audio = AudioBuffer(data)
+    audio.fallback = backend is not tts_router.primary
+    return audio
+
+async def _load_or_synthesize(key, priority=TTS_PRIORITY_RESPONSE, guild_id=None):
+    """ディスクキャッシュを確認し、なければVOICEVOXで合成してディスクに保存する"""
+    data = tts_disk_cache.get(key)
+    if data is not None:
+        return data
+    data = await _synthesize_voicevox(key, priority, guild_id)
+    if data:
+        tts_disk_cache.put(key, data)
+    return data
+
+# ==========================================
+# TTS BACKENDS
+# ==========================================
+# 優先度ごとに、VOICEVOXをこの秒数待っても返らなければ予備のエンジンに切り替える（ない優先度は切り替えない）
+TTS_FALLBACK_DEADLINE = {
+    TTS_PRIORITY_RESPONSE: 3.0,
+    TTS_PRIORITY_GAME: 3.0,
+    TTS_PRIORITY_GREETING: 5.0,
+    TTS_PRIORITY_READOUT: 5.0,
+}
+TTS_FALLBACK_SECONDS_PER_CHAR = 0.1  # 長い文はそのぶん待つ（Pi上のVOICEVOXは1文字あたりこのくらいかかる）
+
+def tts_fallback_deadline(priority, text: str):
+    """予備のエンジンに切り替えるまで待つ秒数（切り替えない優先度ならNone）"""
+    base = TTS_FALLBACK_DEADLINE.get(priority)
+    if base is None:
+        return None
+    return base + len(text) * TTS_FALLBACK_SECONDS_PER_CHAR
+
+class TTSBackend(abc.ABC):
+    """読み上げエンジンの共通インターフェース"""
+    name = "?"
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    @abc.abstractmethod
+    async def synthesize(self, key, priority=TTS_PRIORITY_RESPONSE, guild_id=None):
+        """キー (テキスト, 話者ID[, 倍速]) を合成してWAVのbytesを返す（失敗ならNone、読めない文字列なら空）"""
+
+class VoicevoxBackend(TTSBackend):
+    """VOICEVOXエンジンプール（メモリ・ディスクキャッシュ付き）"""
+    name = "VOICEVOX"
+
+    async def synthesize(self, key, priority=TTS_PRIORITY_RESPONSE, guild_id=None):
+        return await tts_cache.get_or_create(key, lambda: _load_or_synthesize(key, priority, guild_id))
+
+class OpenJTalkBackend(TTSBackend):
+    """pyopenjtalk で同じプロセス内で合成する予備のエンジン（声は1種類・外部サービス不要）"""
+    name = "OpenJTalk"
+
+    def __init__(self):
+        # pyopenjtalk はスレッドセーフではないので専用スレッド1本で合成する
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="openjtalk")
+
+    @property
+    def available(self) -> bool:
+        return pyopenjtalk is not None
+
+    async def synthesize(self, key, priority=TTS_PRIORITY_RESPONSE, guild_id=None):
+        clean_text, _speaker, *rest = key
+        speed = rest[0] if rest else 1.0
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, self._synthesize, clean_text, speed)
+        except Exception as e:
+            print(f"⚠️ OpenJTalk合成エラー: {e}")
+            return None
+
+    @staticmethod
+    def _synthesize(text, speed):
+        samples, rate = pyopenjtalk.tts(text, speed=speed)
+        return build_wav(np.clip(samples, -32768, 32767).astype(np.int16), rate)
+
+class TTSRouter:
+    """primary を優先し、期限までに返らない・失敗したときは fallback の結果を使う"""
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.latency_stats = {}  # {エンジン名: [件数, 合計秒, 最大秒]}
+
+    async def synthesize(self, key, priority=TTS_PRIORITY_RESPONSE, guild_id=None):
+        """(WAVのbytes, 使ったエンジン) を返す"""
+        started = time.perf_counter()
+        deadline = tts_fallback_deadline(priority, key[0]) if self.fallback.available else None
+        if deadline is not None and not any(e.available for e in voicevox_pool.engines):
+            deadline = 0  # VOICEVOXが全台切り離し中なら待たない
+
+        # primary は途中で止めない（遅れて返った結果もキャッシュに載って次から使える）
+        primary = asyncio.ensure_future(self.primary.synthesize(key, priority, guild_id))
+        if deadline is None:
+            return self._done(await primary, self.primary, priority, started)
+        done, _ = await asyncio.wait({primary}, timeout=deadline)
+        if primary in done and primary.result() is not None:
+            return self._done(primary.result(), self.primary, priority, started)
+
+        fallback = asyncio.ensure_future(self.fallback.synthesize(key, priority, guild_id))
+        pending = {primary, fallback} - done
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in (primary, fallback):
+                if task in done and task.result() is not None:
+                    return self._done(task.result(), self.primary if task is primary else self.fallback, priority, started)
+        return self._done(None, self.fallback, priority, started)
+
+    def _done(self, data, backend, priority, started):
+        elapsed = time.perf_counter() - started
+        record_wait(self.latency_stats, backend.name, elapsed)
+        if priority < TTS_PRIORITY_PREWARM:
+            status = "" if data is not None else " 失敗"
+            print(f"🗣️ TTS {backend.name}{status} {elapsed:.2f}秒 ({TTS_PRIORITY_NAMES.get(priority, priority)})")
+        return data, backend
+
+tts_router = TTSRouter(VoicevoxBackend(), OpenJTalkBackend())
+
+# ==========================================
+# TTS PREWARM
+# ==========================================
+tts_prewarm_task: asyncio.Task = None
+
+def prewarm_phrases() -> list[str]:
+    """起動時に合成しておく定型文（ダイス・挨拶など）"""
+    phrases = ["わしが来てやったぞ。", "声を変えたのじゃ！", "ソーチョー", "集計完了じゃ。"]
+    # マイボイス登録者はよく来る人なので参加時の挨拶も用意しておく
+    for guild in bot.guilds:
+        for user_id in user_voices:
+            member = guild.get_member(int(user_id))
+            if member:
+                phrases.append(greeting_text([member.display_name]))
+    # ダイスの読み上げ（1〜100 × 出目帯ごとのリアクション）
+    for res in range(1, 101):
+        for reaction in dice_reaction_words(res):
+            phrases.append(f"{res}。{reaction}。")
+    return list(dict.fromkeys(phrases))
+
+async def prewarm_tts(speaker: int):
+    """定型文をバックグラウンドで合成してキャッシュに載せる"""
+    started = time.time()
+    synthesized = 0
+    cached = 0
+    for text in prewarm_phrases():
+        key = (clean_tts_text(text), speaker)
+        if tts_cache.get(key) is not None or tts_disk_cache.contains(key):
+            cached += 1
+            continue
+        # 最低優先度で合成するので本番の読み上げを邪魔しない
+        if await tts_cache.get_or_create(key, lambda: _load_or_synthesize(key, TTS_PRIORITY_PREWARM)) is None:
+            print("⚠️ 定型文の事前合成を中断しました (VOICEVOXが応答しません)")
+            return
+        synthesized += 1
+    print(f"🔥 定型文の事前合成完了 (話者ID={speaker}, 合成 {synthesized}件 / キャッシュ済み {cached}件, {time.time() - started:.0f}秒)")
+
+def start_tts_prewarm():
+    """現在の SPEAKER_ID で事前合成を開始する（実行中なら止めてやり直す）"""
+    global tts_prewarm_task
+    if tts_prewarm_task and not tts_prewarm_task.done():
+        tts_prewarm_task.cancel()
+    tts_prewarm_task = asyncio.create_task(prewarm_tts(SPEAKER_ID))
+
+VOICE_PREVIEW_TEXT = "こんにちは。この声で読み上げるのじゃ。"  # 声の試聴用サンプル
+VOICE_PREVIEW_CONCURRENCY = 2  # 試聴サンプルを同時に合成する数
+voice_preview_task: asyncio.Task = None
+
+def voice_preview_key(style_id: int) -> tuple:
+    return tts_cache_key(VOICE_PREVIEW_TEXT, style_id)
+
+async def render_voice_previews():
+    """全スタイルの試聴サンプルをディスクキャッシュに用意する（メモリキャッシュは使わない）"""
+    started = time.time()
+    missing = [style_id for style_id in speaker_map_reverse if not tts_disk_cache.contains(voice_preview_key(style_id))]
+    if not missing:
+        return
+    semaphore = asyncio.Semaphore(VOICE_PREVIEW_CONCURRENCY)
+    failed = asyncio.Event()
+
+    async def render(style_id):
+        async with semaphore:
+            if failed.is_set():
+                return
+            # 空データ（そのスタイルだけ4xx）は飛ばし、応答なし（None）のときだけ全体を止める
+            if await _load_or_synthesize(voice_preview_key(style_id), TTS_PRIORITY_PREWARM) is None:
+                failed.set()
+
+    await asyncio.gather(*(render(style_id) for style_id in missing))
+    if failed.is_set():
+        print("⚠️ 試聴サンプルの合成を中断しました (VOICEVOXが応答しません)")
+        return
+    print(f"🔥 試聴サンプルの合成完了 ({len(missing)}スタイル, {time.time() - started:.0f}秒)")
+
+def start_voice_previews():
+    """試聴サンプルの合成をバックグラウンドで開始する（実行中なら何もしない）"""
+    global voice_preview_task
+    if voice_preview_task is None or voice_preview_task.done():
+        voice_preview_task = asyncio.create_task(render_voice_previews())
+
+async def _synthesize_voicevox(key, priority=TTS_PRIORITY_RESPONSE, guild_id=None):
+    """スケジューラの順番を待ってから、VOICEVOXエンジンプールで合成してWAVのbytesを返す"""
+    async with voicevox_scheduler.slot(priority, guild_id):
+        return await voicevox_pool.request(lambda engine: _synthesize_on(engine, *key))
+
+async def _synthesize_on(engine, clean_text, speaker, speed=1.0):
+    """VOICEVOXの /audio_query → /synthesis を呼んでWAVのbytesを返す"""
     params = {'text': clean_text, 'speaker': speaker}
+    async with http_session.post(f'{engine.url}/audio_query', params=params, timeout=VOICEVOX_REQUEST_TIMEOUT) as resp:
+        if resp.status != 200: return _voicevox_error_result(resp)
+        query = await resp.json()
+    if speed != 1.0:
+        # 早口にし、前後の無音も縮める
+        query["speedScale"] = query.get("speedScale", 1.0) * speed
+        query["prePhonemeLength"] = query.get("prePhonemeLength", 0.1) / speed
+        query["postPhonemeLength"] = query.get("postPhonemeLength", 0.1) / speed
+    async with http_session.post(f'{engine.url}/synthesis', params=params, json=query, timeout=VOICEVOX_REQUEST_TIMEOUT) as resp:
+        if resp.status != 200: return _voicevox_error_result(resp)
+        return await resp.read()
+
+def _voicevox_error_result(resp):
+    """4xx（読めない文字列など）はエンジンの故障ではないので空データを返し、フェイルオーバーさせない"""
+    print(f"⚠️ VOICEVOX {resp.url.path} 失敗: {resp.status}")
+    return b'' if 400 <= resp.status < 500 else None
+
+# ==========================================
+# TTS AUDIO SOURCE
+# ==========================================
+DISCORD_SAMPLE_RATE = 48000
+DISCORD_FRAME_SAMPLES = 960  # 20ms
+
+def parse_wav(buf) -> tuple[np.ndarray, int]:
+    """16bit PCMのWAVを解析し、(サンプル配列[フレーム数, ch], サンプリングレート) を返す（コピーなし）"""
+    if len(buf) < 12 or bytes(buf[0:4]) != b"RIFF" or bytes(buf[8:12]) != b"WAVE":
+        raise ValueError("WAVではありません")
+    pos = 12
+    fmt = None
+    while pos + 8 <= len(buf):
+        chunk_id = bytes(buf[pos:pos + 4])
+        chunk_size, = struct.unpack_from("<I", buf, pos + 4)
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack_from("<HHIIHH", buf, body)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("fmtチャンクがありません")
+            audio_format, channels, rate, _, _, bits = fmt
+            if audio_format != 1 or bits != 16:
+                raise ValueError(f"未対応のWAV形式です (format={audio_format}, bits={bits})")
+            # ストリーミング出力だとサイズが不正なことがあるので実データ長で切る
+            size = min(chunk_size, len(buf) - body)
+            frames = size // (2 * channels)
+            samples = np.frombuffer(buf, dtype="<i2", count=frames * channels, offset=body)
+            return samples.reshape(-1, channels), rate
+        pos = body + chunk_size + (chunk_size & 1)
+    raise ValueError("dataチャンクがありません")
+
+def wav_header(data_bytes: int, rate: int, channels: int) -> bytes:
+    """16bit PCMのWAVヘッダ（44バイト）"""
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_bytes, b"WAVE",
+        b"fmt ", 16, 1, channels, rate, rate * channels * 2, channels * 2, 16,
+        b"data", data_bytes,
+    )
+
+def build_wav(samples: np.ndarray, rate: int) -> bytes:
+    """16bit PCMのサンプル配列[フレーム数, ch]からWAVを作る"""
+    channels = samples.shape[1] if samples.ndim == 2 else 1
+    pcm = np.ascontiguousarray(samples, dtype="<i2")
+    return b"".join([wav_header(pcm.nbytes, rate, channels), memoryview(pcm).cast("B")])
+
+def concat_wavs(buffers: list):
+    """複数のWAVを話者の切れ目に短い無音を挟んで1つにつなげる（形式が違えば先頭に合わせて変換）"""
+    if not buffers:
+        return None
+    if len(buffers) == 1:
+        return buffers[0]
+    base, rate = parse_wav(buffers[0].getbuffer())
+    channels = base.shape[1]
+    gap = np.zeros((int(rate * TTS_SEGMENT_GAP), channels), dtype=np.int16)
+    parts = [base]
+    for audio_data in buffers[1:]:
+        samples, src_rate = parse_wav(audio_data.getbuffer())
+        if samples.shape[1] != channels:
+            samples = np.repeat(samples.mean(axis=1, keepdims=True), channels, axis=1).astype(np.int16)
+        if src_rate != rate:
+            t = np.arange(int(len(samples) * rate / src_rate)) * (src_rate / rate)
+            samples = np.stack([np.interp(t, np.arange(len(samples)), samples[:, c]) for c in range(channels)], axis=1).astype(np.int16)
+        parts += [gap, samples]
+    return AudioBuffer(build_wav(np.concatenate(parts), rate))
+
+class WavPCMSource(discord.AudioSource):
+    """WAVをメモリ上で48kHzステレオに変換して20msずつ返すAudioSource（ffmpegを起動しない）
+
+    リサンプリング（線形補間）・チャンネル複製・音量調整を1フレームごとにまとめてNumPyで行う。
+    """
+    def __init__(self, audio_data, volume=1.0):
+        self.samples, rate = parse_wav(audio_data.getbuffer())
+        self.volume = volume
+        self._ratio = rate / DISCORD_SAMPLE_RATE
+        self._total = int(len(self.samples) / self._ratio)  # 出力サンプル数（48kHz）
+        self._pos = 0
+        self._offsets = np.arange(DISCORD_FRAME_SAMPLES)
+
+    def read(self):
+        if self._pos >= self._total:
+            return b''
+        n = min(DISCORD_FRAME_SAMPLES, self._total - self._pos)
+        t = (self._pos + self._offsets[:n]) * self._ratio
+        i0 = t.astype(np.int64)
+        i1 = np.minimum(i0 + 1, len(self.samples) - 1)
+        frac = (t - i0)[:, None]
+        x = self.samples[i0] * (1.0 - frac) + self.samples[i1] * frac
+        x *= self.volume
+        frame = np.zeros((DISCORD_FRAME_SAMPLES, 2), dtype=np.int16)  # 最後の半端なフレームは無音で埋める
+        frame[:n] = np.clip(x, -32768, 32767)  # モノラルは左右に複製される
+        self._pos += n
+        return frame.tobytes()
+
+    def is_opus(self):
+        return False
+
+class OpusFrameSource(discord.AudioSource):
+    """エンコード済みのOpusパケットをそのまま送るAudioSource（エンコード処理なし）"""
+    def __init__(self, packets):
+        self.packets = packets
+        self._pos = 0
+
+    def read(self):
+        if self._pos >= len(self.packets):
+            return b''
+        packet = self.packets[self._pos]
+        self._pos += 1
+        return packet
+
+    def is_opus(self):
+        return True
+
+def encode_opus_frames(audio_data) -> list[bytes]:
+    """WAVを20msごとのOpusパケット列にエンコードする（executorで実行する）"""
+    encoder = discord.opus.Encoder()
+    source = WavPCMSource(AudioBuffer(audio_data.getbuffer()), volume=TTS_VOLUME)
+    packets = []
+    while frame := source.read():
+        packets.append(encoder.encode(frame, DISCORD_FRAME_SAMPLES))
+    return packets
+
+async def prepare_tts_audio(text, speaker, priority=TTS_PRIORITY_RESPONSE, guild_id=None, speed=1.0):
+    """再生用の音声を用意する（エンコード済みOpusがあればパケット列を、なければWAVを返す）"""
+    packets = tts_opus_cache.get(tts_cache_key(text, speaker, speed) + (TTS_VOLUME,))
+    if packets is not None:
+        tts_opus_cache.hits += 1
+        return packets
+    tts_opus_cache.misses += 1
+    return await generate_wav(text, speaker, priority, guild_id, speed)
+
+def note_tts_played(text, speaker, audio_data):
+    """再生回数を数え、よく使われる文になったらバックグラウンドでOpusにエンコードしておく"""
+    if isinstance(audio_data, list) or getattr(audio_data, "fallback", False):
+        return
+    key = tts_cache_key(text, speaker)
+    count = tts_play_counts.pop(key, 0) + 1
+    tts_play_counts[key] = count
+    if len(tts_play_counts) > 1024:
+        tts_play_counts.popitem(last=False)
+    if count == TTS_OPUS_HOT_PLAYS:
+        asyncio.create_task(_cache_opus_frames(key + (TTS_VOLUME,), audio_data))
+
+async def _cache_opus_frames(opus_key, audio_data):
     try:
-        async with http_session.post(f'{VOICEVOX_URL}/audio_query', params=params) as resp:
-            if resp.status != 200: return None
-            query = await resp.json()
-        async with http_session.post(f'{VOICEVOX_URL}/synthesis', params=params, json=query) as resp:
-            if resp.status != 200: return None
-            data = await resp.read()
-            return io.BytesIO(data)
-    except Exception as e: print(f"⚠️ エラー: {e}"); return None
-
-def play_audio(guild, audio_data: io.BytesIO):
-    """io.BytesIOの音声データをキューに追加する"""
-    state = get_guild_state(guild.id)
-    if guild.voice_client is None or state["is_playing_music"]:
+        loop = asyncio.get_running_loop()
+        packets = await loop.run_in_executor(None, encode_opus_frames, audio_data)
+        tts_opus_cache.put(opus_key, packets)
+    except Exception as e:
+        print(f"⚠️ Opusエンコードエラー: {e}")
+
+def make_tts_source(audio_data):
+    """TTS用のAudioSourceを作る（Opusパケット列ならそのまま、対応外のWAVならffmpegで変換する）"""
+    if isinstance(audio_data, list):
+        return OpusFrameSource(audio_data)
+    try:
+        return WavPCMSource(audio_data, volume=TTS_VOLUME)
+    except ValueError as e:
+        print(f"⚠️ WAV解析失敗のためffmpegで再生します: {e}")
+        audio_data.seek(0)
+        return discord.PCMVolumeTransformer(
+            discord.FFmpegPCMAudio(audio_data, pipe=True, executable='ffmpeg'),
+            volume=TTS_VOLUME
+        )
+
+# ==========================================
+# AUDIO MIXER（音楽に読み上げを重ねる）
+# ==========================================
+MUSIC_DUCK_GAIN = 0.3      # 読み上げ中の音楽の音量（倍率）
+MUSIC_DUCK_SECONDS = 0.25  # 音楽の音量を下げる・戻すのにかける時間（秒）
+DISCORD_FRAME_BYTES = DISCORD_FRAME_SAMPLES * 2 * 2  # 20ms・ステレオ・16bit
+
+class MixerSource(discord.AudioSource):
+    """音楽と読み上げを1本にまとめて流すAudioSource
+
+    読み上げがある間は音楽の音量をなめらかに下げ（ダッキング）、20msごとにNumPyで足し合わせる。
+    片方しか流れていなければそのフレームをそのまま返す（読み上げだけのときはOpusパケットもデコードしない）。
+    両方終わったらミキサーも終わる。
+    各ストリームの after は、終わった・差し替えた・止めたときに1回だけ呼ばれる。
+    """
+    def __init__(self, music=None, music_after=None):
+        self._lock = threading.Lock()
+        self._streams = {"music": (music, music_after), "tts": (None, None)}
+        self._decoder = None
+        self._gain = 1.0
+        self._step = (1.0 - MUSIC_DUCK_GAIN) / max(MUSIC_DUCK_SECONDS / 0.02, 1)
+        self._ramp = np.linspace(0.0, 1.0, DISCORD_FRAME_SAMPLES, dtype=np.float32)[:, None]
+        self._opus_frame = False  # 直前に返したフレームがOpusパケットのままか
+        self.finished = False
+
+    @property
+    def original(self):
+        # update_source_volume で音楽の音量を変えられるようにする
+        return self._streams["music"][0]
+
+    def set_music(self, source, after=None) -> bool:
+        return self._swap("music", source, after)
+
+    def play_tts(self, source, after=None) -> bool:
+        return self._swap("tts", source, after)
+
+    def stop_music(self):
+        self._swap("music", None, None)
+
+    def stop_tts(self):
+        self._swap("tts", None, None)
+
+    def _swap(self, name, source, after) -> bool:
+        with self._lock:
+            if self.finished and source is not None:
+                return False  # もう終わったミキサーには足せない
+            old = self._streams[name]
+            self._streams[name] = (source, after)
+        self._end(*old)
+        return True
+
+    @staticmethod
+    def _end(source, after):
+        if source is None:
+            return
+        source.cleanup()
+        if after:
+            try:
+                after(None)
+            except Exception as e:
+                print(f"⚠️ ミキサーのafterエラー: {e}")
+
+    def _read_stream(self, name, decode=True):
+        """(フレーム, Opusパケットのままか) を返す（流れていなければフレームはNone）"""
+        source, after = self._streams[name]
+        if source is None:
+            return None, False
+        frame = source.read()
+        opus = bool(frame) and source.is_opus()
+        if opus and decode:
+            # キャッシュ済みのOpusパケットはデコードしてから重ねる
+            if self._decoder is None:
+                self._decoder = discord.opus.Decoder()
+            frame = self._decoder.decode(frame)
+            opus = False
+        if not opus and len(frame) < DISCORD_FRAME_BYTES:
+            with self._lock:
+                if self._streams[name][0] is not source:
+                    return None, False  # 読んでいる間に差し替えられた
+                self._streams[name] = (None, None)
+            self._end(source, after)
+            if not frame:
+                return None, False
+            frame = frame.ljust(DISCORD_FRAME_BYTES, b'\0')
+        return frame, opus
+
+    def read(self):
+        music, _ = self._read_stream("music")
+        # 音楽がなければ読み上げのOpusパケットはそのまま送る（再エンコードしない）
+        tts, self._opus_frame = self._read_stream("tts", decode=music is not None)
+        target = MUSIC_DUCK_GAIN if tts is not None else 1.0
+        if music is None:
+            self._gain = target
+            if tts is not None:
+                return tts
+            with self._lock:
+                if any(source is not None for source, _ in self._streams.values()):
+                    return bytes(DISCORD_FRAME_BYTES)  # 今ちょうど足されたところ
+                self.finished = True
+            return b''
+        if tts is None and self._gain == 1.0:
+            return music
+
+        g0 = self._gain
+        g1 = max(g0 - self._step, target) if target < g0 else min(g0 + self._step, target)
+        self._gain = g1
+        mixed = np.frombuffer(music, dtype=np.int16).reshape(-1, 2).astype(np.float32)
+        mixed *= g0 + (g1 - g0) * self._ramp
+        if tts is not None:
+            mixed += np.frombuffer(tts, dtype=np.int16).reshape(-1, 2)
+        return np.clip(mixed, -32768, 32767).astype(np.int16).tobytes()
+
+    def is_opus(self):
+        # AudioPlayer はフレームごとに確認するので、直前に返したフレームに合わせる
+        return self._opus_frame
+
+    def cleanup(self):
+        with self._lock:
+            self.finished = True
+            streams = list(self._streams.values())
+            self._streams = {"music": (None, None), "tts": (None, None)}
+        for stream in streams:
+            self._end(*stream)
+
+def active_mixer(vc):
+    source = vc.source if vc.is_playing() else None
+    return source if isinstance(source, MixerSource) else None
+
+def play_music(vc, source, after=None):
+    """音楽を再生する（ミキサーが動いていれば曲だけ差し替え、読み上げは止めない）"""
+    mixer = active_mixer(vc)
+    if mixer and mixer.set_music(source, after):
         return
+    if vc.is_playing():
+        vc.stop()
+    vc.play(MixerSource(source, after))
 
-    state["tts_queue"].put_nowait(audio_data)
+def stop_music(vc):
+    """音楽だけを止める（重ねている読み上げは最後まで流す）"""
+    mixer = active_mixer(vc)
+    if mixer:
+        mixer.stop_music()
+    else:
+        vc.stop()
 
-@tasks.loop(seconds=1)
-async def tts_queue_worker():
-    """各ギルドのTTSキューを消費して再生する"""
-    for guild_id, state in list(guild_state.items()):
-        queue = state["tts_queue"]
-        if queue.empty():
-            continue
+def play_tts_source(vc, audio_data, after):
+    """読み上げを再生する（いつもミキサー経由にして、後から始まった音楽でも止めずに重ねる）"""
+    source = make_tts_source(audio_data)
+    mixer = active_mixer(vc)
+    if mixer and mixer.play_tts(source, after):
+        return
+    if vc.is_playing():
+        vc.stop()
+    mixer = MixerSource()
+    mixer.play_tts(source, after)
+    vc.play(mixer)
+
+def stop_tts_playback(vc):
+    """再生中の読み上げだけを止める（音楽に重ねていれば音楽はそのまま）"""
+    mixer = active_mixer(vc)
+    if mixer:
+        mixer.stop_tts()
+    else:
+        vc.stop()
 
-        guild = bot.get_guild(guild_id)
-        if not guild:
-            continue
+def tts_blocked_by_music(state: dict) -> bool:
+    return state["is_playing_music"] and not TTS_OVER_MUSIC
+
+TTS_LOOKAHEAD = 2          # 再生中に先行して合成しておく件数
+TTS_CHUNK_MIN_CHARS = 10   # 分割読み上げでこれより短い文は次の文とまとめる
+TTS_CHUNK_MAX_CHARS = 80   # 分割読み上げの1チャンクの最大文字数
+TTS_READOUT_WINDOW = 0.5   # チャット読み上げをまとめる待ち時間（秒）
+TTS_READOUT_MAX_BATCH = 8  # まとめるメッセージ数の上限
+TTS_SEGMENT_GAP = 0.15     # つなげた音声の話者の切れ目に入れる無音（秒）
+TTS_MAX_QUEUE_DEPTH = 20   # 未再生がこれ以上なら挨拶・読み上げは受け付けずに捨てる
+TTS_PREEMPT_PRIORITY = TTS_PRIORITY_GAME  # この優先度以上のジョブは再生中のチャット読み上げを止めて割り込む（Noneで無効）
+TTS_MAX_AGE = {            # 優先度ごとの賞味期限（秒）。過ぎたものは合成せずに捨てる
+    TTS_PRIORITY_GREETING: 60,
+    TTS_PRIORITY_READOUT: 30,
+}
 
-        vc = guild.voice_client
-        if not vc or not vc.is_connected():
-            continue
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[。！？!?])|\n')
 
-        if state["is_playing_music"]:
-            # 音楽再生中はキューを破棄
-            while not queue.empty():
-                try:
-                    queue.get_nowait()
-                    queue.task_done()
-                except asyncio.QueueEmpty:
-                    break
+def split_tts_sentences(text: str) -> list[str]:
+    """文末（。！？）と改行でテキストを分割する（短すぎる文は次の文とまとめる）"""
+    chunks = []
+    for sentence in _SENTENCE_SPLIT_RE.split(text):
+        sentence = sentence.strip().lstrip("。")  # 正規化で「！。」のように続いた句点
+        if not sentence:
             continue
+        if chunks and len(chunks[-1]) < TTS_CHUNK_MIN_CHARS and len(chunks[-1]) + len(sentence) <= TTS_CHUNK_MAX_CHARS:
+            if not chunks[-1].endswith(("。", "！", "？", "!", "?")):
+                chunks[-1] += "。"
+            chunks[-1] += sentence
+        else:
+            chunks.append(sentence)
+    return chunks
 
-        # VCが既に何かを再生中の場合は順番待ち
-        if vc.is_playing():
-            continue
+def queue_tts(guild, text, speaker, priority, chunked=False):
+    """読み上げるテキストをギルドのTTSキューに追加する（合成は再生コルーチン側で先読みする）
+
+    priority は TTS_PRIORITY_* で、VOICEVOXへのリクエスト順に使われる。
+    chunked=True なら文ごとに分けて追加し、最初の文が合成でき次第再生を始める。
+    """
+    state = get_guild_state(guild.id)
+    if guild.voice_client is None or tts_blocked_by_music(state):
+        return
+
+    # URLやコードブロックを先にまとめておく（文ごとに分けてからだと「?」や改行で途中から切れる）
+    for chunk in (split_tts_sentences(clean_tts_text(text)) if chunked else [text]):
+        put_tts_job(guild.id, [(chunk, speaker)], priority)
+
+_tts_job_seq = itertools.count()  # 同じ優先度のジョブはキューに入れた順に再生する
 
-        audio_data = queue.get_nowait()
+def put_tts_job(guild_id: int, segments: list, priority: int):
+    """[(テキスト, 話者ID), ...] を1つの音声として再生するジョブをキューに入れる"""
+    state = get_guild_state(guild_id)
+    if state["tts_backlog"] >= TTS_MAX_QUEUE_DEPTH and priority >= TTS_PRIORITY_GREETING:
+        state["tts_stats"]["dropped"] += 1
+        return
+    job = {
+        "segments": segments, "priority": priority, "guild_id": guild_id, "enqueued_at": time.time(),
+        "est_seconds": sum(len(clean_tts_text(text)) for text, _ in segments) * TTS_SECONDS_PER_CHAR,
+        "speed": 1.0, "task": None,
+    }
+    if state["tts_backlog"] == 0:
+        # キューが空から溜まり始めたら、解消するまでの時間を計る
+        state["tts_drain"] = {"started": time.time(), "jobs": 0, "seconds": 0.0, "peak": 0, "synthesized": 0, "speed_sum": 0.0}
+    drain = state["tts_drain"]
+    drain["jobs"] += 1
+    drain["seconds"] += job["est_seconds"]
+    state["tts_queue"].put_nowait((priority, next(_tts_job_seq), job))
+    state["tts_backlog"] += 1
+    state["tts_backlog_seconds"] += job["est_seconds"]
+    drain["peak"] = max(drain["peak"], state["tts_backlog"])
+    ensure_tts_worker(guild_id)
+
+def tts_speed_for(state: dict) -> float:
+    """未再生のジョブ数と音声の長さから読み上げ速度を決める（0.1刻み）"""
+    depth_limit = TTS_SPEEDUP["queue_depth"]
+    start = TTS_SPEEDUP["queued_seconds"]
+    full = max(TTS_SPEEDUP["max_queued_seconds"], start + 1)
+    by_depth = (state["tts_backlog"] - depth_limit) / max(depth_limit, 1)
+    by_seconds = (state["tts_backlog_seconds"] - start) / (full - start)
+    pressure = min(1.0, max(0.0, by_depth, by_seconds))
+    speed = 1.0 + (TTS_SPEEDUP["max_speed"] - 1.0) * pressure
+    return round(speed, 1)
+
+def queue_readout(guild, text, speaker):
+    """チャット読み上げをキューに入れる
+
+    読み上げ中に続けて届いたメッセージは TTS_READOUT_WINDOW 秒ぶんまとめて1つの音声にする。
+    同じ話者が続く部分は1回の合成にまとめるので、VOICEVOXへのリクエストと再生の切れ目が減る。
+    """
+    state = get_guild_state(guild.id)
+    vc = guild.voice_client
+    if vc is None or tts_blocked_by_music(state):
+        return
+
+    batch = state["readout_batch"]
+    if not batch and state["tts_backlog"] == 0 and not vc.is_playing():
+        # 何も再生していなければ待たずに読む
+        put_tts_job(guild.id, [(text, speaker)], TTS_PRIORITY_READOUT)
+        return
+
+    batch.append((text, speaker))
+    if len(batch) >= TTS_READOUT_MAX_BATCH:
+        flush_readout(guild.id)
+    elif state["readout_flush"] is None:
+        state["readout_flush"] = asyncio.get_running_loop().call_later(TTS_READOUT_WINDOW, flush_readout, guild.id)
+
+def flush_readout(guild_id: int):
+    """溜めておいたチャット読み上げを1つのジョブにしてキューに入れる"""
+    state = get_guild_state(guild_id)
+    if state["readout_flush"] is not None:
+        state["readout_flush"].cancel()
+        state["readout_flush"] = None
+    batch, state["readout_batch"] = state["readout_batch"], []
+    if not batch:
+        return
+
+    segments = []
+    for text, speaker in batch:
+        if segments and segments[-1][1] == speaker:
+            segments[-1] = (f"{segments[-1][0]}。{text}", speaker)
+        else:
+            segments.append((text, speaker))
+    put_tts_job(guild_id, segments, TTS_PRIORITY_READOUT)
+
+def ensure_tts_worker(guild_id: int):
+    """ギルドのTTS再生コルーチンが動いていなければ起動する"""
+    state = get_guild_state(guild_id)
+    task = state["tts_worker"]
+    if task is None or task.done():
+        state["tts_worker"] = asyncio.create_task(tts_worker(guild_id))
+
+def stop_tts_worker(guild_id: int):
+    """TTS再生コルーチンを止め、キューに残ったジョブを破棄する"""
+    state = get_guild_state(guild_id)
+    task = state["tts_worker"]
+    if task and not task.done():
+        task.cancel()
+    state["tts_worker"] = None
+    if state["readout_flush"] is not None:
+        state["readout_flush"].cancel()
+        state["readout_flush"] = None
+    state["readout_batch"] = []
+    drain_tts_queue(state)
+
+def drain_tts_queue(state: dict):
+    queue = state["tts_queue"]
+    while not queue.empty():
         try:
-            source = discord.PCMVolumeTransformer(
-                discord.FFmpegPCMAudio(audio_data, pipe=True, executable='ffmpeg'),
-                volume=TTS_VOLUME
-            )
-            vc.play(source)
-        except Exception as e:
-            print(f"⚠️ TTS再生エラー: {e}")
-        finally:
-            queue.task_done()
+            _, _, job = queue.get_nowait()
+            finish_tts_job(state, job)
+        except asyncio.QueueEmpty:
+            break
+
+def finish_tts_job(state: dict, job: dict):
+    state["tts_queue"].task_done()
+    state["tts_backlog"] -= 1
+    state["tts_backlog_seconds"] = max(0.0, state["tts_backlog_seconds"] - job["est_seconds"])
+    drain = state["tts_drain"]
+    if state["tts_backlog"] == 0 and drain and drain["peak"] > TTS_SPEEDUP["queue_depth"]:
+        # 溜まったキューが解消した: 早口設定の効果を比べられるよう記録する
+        drain["elapsed"] = time.time() - drain["started"]
+        drain["avg_speed"] = drain["speed_sum"] / max(drain["synthesized"], 1)
+        state["tts_last_drain"] = drain
+        print(f"📉 読み上げキュー解消: {drain['jobs']}件 (最大{drain['peak']}件待ち, 見積もり{drain['seconds']:.0f}秒) "
+              f"を {drain['elapsed']:.0f}秒で再生 (平均 x{drain['avg_speed']:.2f})")
+        state["tts_drain"] = None
+
+def tts_job_expired(job: dict) -> bool:
+    max_age = TTS_MAX_AGE.get(job["priority"])
+    return max_age is not None and time.time() - job["enqueued_at"] > max_age
+
+def flush_tts(guild_id: int) -> int:
+    """未再生の読み上げを全部捨て、再生中の読み上げも止める（捨てた件数を返す）"""
+    state = get_guild_state(guild_id)
+    dropped = state["tts_backlog"] + len(state["readout_batch"])
+    stop_tts_worker(guild_id)
+    guild = bot.get_guild(guild_id)
+    vc = guild.voice_client if guild else None
+    if vc and state["tts_playing"]:
+        stop_tts_playback(vc)
+    state["tts_stats"]["dropped"] += dropped
+    return dropped
+
+def start_tts_job(job: dict):
+    """ジョブの合成を開始する（この時点のキューの溜まり具合で読み上げ速度を決める）"""
+    state = get_guild_state(job["guild_id"])
+    job["speed"] = tts_speed_for(state)
+    if state["tts_drain"]:
+        state["tts_drain"]["synthesized"] += 1
+        state["tts_drain"]["speed_sum"] += job["speed"]
+    job["task"] = asyncio.create_task(prepare_tts_job(job))
+
+async def prepare_tts_job(job: dict):
+    """ジョブの音声を用意する（複数の話者・文は合成してから1つのWAVにつなげる）"""
+    segments = job["segments"]
+    if len(segments) == 1:
+        text, speaker = segments[0]
+        return await prepare_tts_audio(text, speaker, job["priority"], job["guild_id"], job["speed"])
+    results = await asyncio.gather(*(
+        generate_wav(text, speaker, job["priority"], job["guild_id"], job["speed"]) for text, speaker in segments
+    ))
+    return concat_wavs([audio for audio in results if audio is not None])
+
+async def tts_worker(guild_id: int):
+    """ギルドごとのTTS再生コルーチン
+
+    キューのジョブを優先度の高い順（同じ優先度なら入った順）に再生し、
+    先頭を再生している間に後続の TTS_LOOKAHEAD 件を並行して合成しておく。
+    TTS_PREEMPT_PRIORITY 以上のジョブは、音声ができた時点で再生中のチャット読み上げを止めて割り込む。
+    再生終了は vc.play の after コールバックで通知される。
+    """
+    state = get_guild_state(guild_id)
+    queue = state["tts_queue"]
+    loop = asyncio.get_running_loop()
+    pending = []  # キューから取り出したジョブのヒープ [(優先度, 受付順, ジョブ), ...]
+
+    def preempt(task):
+        playing = state["tts_playing"]
+        if task.cancelled() or playing is None or playing["priority"] < TTS_PRIORITY_READOUT or playing.get("preempted"):
+            return
+        guild = bot.get_guild(guild_id)
+        vc = guild.voice_client if guild else None
+        if vc and vc.is_playing():
+            playing["preempted"] = True
+            stop_tts_playback(vc)
+            state["tts_stats"]["preempted"] += 1
+
+    def collect(slots):
+        # 届いたジョブを手元に移し、優先度の高い順に slots 件まで合成を始める
+        while True:
+            try:
+                heapq.heappush(pending, queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        for _, _, job in heapq.nsmallest(slots, pending):
+            if job["task"] is None and not tts_job_expired(job):
+                start_tts_job(job)
+                if TTS_PREEMPT_PRIORITY is not None and job["priority"] <= TTS_PREEMPT_PRIORITY:
+                    job["task"].add_done_callback(preempt)
+
+    async def prefetch():
+        # 再生中に届いたジョブも合成を始める
+        while True:
+            heapq.heappush(pending, await queue.get())
+            collect(TTS_LOOKAHEAD)
+
+    try:
+        while True:
+            if not pending:
+                heapq.heappush(pending, await queue.get())
+            collect(TTS_LOOKAHEAD + 1)  # 次に再生するジョブ + 先読み
+            _, _, job = heapq.heappop(pending)
+            prefetch_task = asyncio.create_task(prefetch())
+            try:
+                if tts_job_expired(job):
+                    # 賞味期限切れのジョブは再生せずに捨てる
+                    state["tts_stats"]["expired"] += 1
+                    continue
+                audio_data = await job["task"]
+                if audio_data is None:
+                    continue
+                if tts_job_expired(job):
+                    # 合成を待つ間に古くなった
+                    state["tts_stats"]["expired"] += 1
+                    continue
+
+                guild = bot.get_guild(guild_id)
+                vc = guild.voice_client if guild else None
+                if not vc or not vc.is_connected():
+                    # VCから抜けていたら残りを捨てて終了
+                    drain_tts_queue(state)
+                    return
+
+                if tts_blocked_by_music(state):
+                    # 音楽に重ねない設定なら破棄
+                    continue
+
+                finished = asyncio.Event()
+                # 再生終了（またはstop）でプレイヤースレッドから起こしてもらう
+                play_tts_source(vc, audio_data, after=lambda error: loop.call_soon_threadsafe(finished.set))
+                state["tts_playing"] = job
+                record_wait(state["tts_latency"], job["priority"], time.time() - job["enqueued_at"])
+                if len(job["segments"]) == 1 and job["speed"] == 1.0:
+                    note_tts_played(*job["segments"][0], audio_data)
+                await finished.wait()
+            except Exception as e:
+                print(f"⚠️ TTS再生エラー: {e}")
+            finally:
+                state["tts_playing"] = None
+                prefetch_task.cancel()
+                if job["task"] is not None:
+                    job["task"].cancel()
+                finish_tts_job(state, job)
+    finally:
+        for _, _, job in pending:
+            if job["task"] is not None:
+                job["task"].cancel()
+            finish_tts_job(state, job)
 
 
 # ==========================================
 # ROLLING BUFFER SINK（会話検知用）
 # ==========================================
+VOICE_JITTER_SECONDS = 0.2   # 同じ人のパケットがこの秒数以内の遅れで届いたら前のパケットの直後に並べる
+VOICE_GAP_MAX_SECONDS = 1.0  # 誰も話していない時間がこれより長ければ詰める
+VOICE_GAP_KEEP_SECONDS = 0.5 # 詰めた所に残す無音（STT用の区切り）
+
 class RollingBufferSink(voice_recv.AudioSink):
-    """全ユーザーの音声をローリングバッファに蓄積するシンク"""
+    """全ユーザーの音声をローリングバッファに蓄積するシンク
+
+    受信スレッドから20msごとに呼ばれるので、あらかじめ確保したリングバッファ（1パケット=1スロット）に
+    その場で書き込み、古いパケットは先頭を進めるだけで捨てる。メモリは buffer_seconds ぶんで一定。
+    パケットは話者ごとの再生位置（受信時刻基準のサンプル位置）と一緒に持ち、
+    取り出すときに時刻を揃えて重ねる（同時に話した人の声が順番につながって長くならない）。
+    """
     def __init__(self, guild_id, buffer_seconds=60):
         super().__init__()
         self.guild_id = guild_id
         self.buffer_seconds = buffer_seconds
-        self._buffer = []  # [(timestamp, pcm_bytes), ...]
+        slots = int(buffer_seconds * DISCORD_SAMPLE_RATE) // DISCORD_FRAME_SAMPLES
+        self._pcm = np.zeros((slots, DISCORD_FRAME_SAMPLES, 2), dtype=np.int16)
+        self._starts = np.zeros(slots, dtype=np.int64)    # 再生位置（self._epoch からのサンプル数）
+        self._lengths = np.zeros(slots, dtype=np.int32)   # スロット内の有効サンプル数
+        self._speakers = np.zeros(slots, dtype=np.int32)  # 話者の番号
+        self._head = 0   # 一番古いパケットのスロット
+        self._count = 0  # 入っているパケット数
+        self._epoch = time.time()
+        self._speaker_ids = {}  # {ユーザーID（不明ならSSRC）: 話者の番号}
+        self._next_start = {}   # {話者の番号: 次のパケットを置く位置}
+        self._lock = threading.Lock()
         self._write_count = 0
 
     def wants_opus(self):
@@ -397,47 +1864,102 @@ class RollingBufferSink(voice_recv.AudioSink):
         except Exception as e:
             print(f"⚠️ RollingBufferSink.write エラー: {e}")
         self._write_count += 1
-        # PCMデータをコピーして保存（バッファ再利用対策）
-        pcm_copy = bytes(data.pcm) if data.pcm else b''
-        self._buffer.append((now, pcm_copy))
-        # 古いデータを削除
-        cutoff = now - self.buffer_seconds
-        self._buffer = [(t, d) for t, d in self._buffer if t >= cutoff]
+        if not data.pcm:
+            return
+        # PCMデータはスロットにコピーして保存（バッファ再利用対策）
+        samples = np.frombuffer(data.pcm, dtype=np.int16).reshape(-1, 2)
+        key = user.id if user is not None else getattr(getattr(data, "packet", None), "ssrc", None)
+        arrival = int((now - self._epoch) * DISCORD_SAMPLE_RATE)
+        with self._lock:
+            speaker = self._speaker_ids.setdefault(key, len(self._speaker_ids))
+            start = self._next_start.get(speaker)
+            if start is None or arrival - start > VOICE_JITTER_SECONDS * DISCORD_SAMPLE_RATE:
+                start = arrival  # 話し始め（前の発言から間が空いた）
+            for pos in range(0, len(samples), DISCORD_FRAME_SAMPLES):
+                chunk = samples[pos:pos + DISCORD_FRAME_SAMPLES]
+                self._append(start, speaker, chunk)
+                start += len(chunk)
+            self._next_start[speaker] = start
+            # 古いデータを削除（先頭を進めるだけ）
+            cutoff = arrival - self.buffer_seconds * DISCORD_SAMPLE_RATE
+            while self._count and self._starts[self._head] < cutoff:
+                self._pop_oldest()
+
+    def _append(self, start, speaker, chunk):
+        slots = len(self._starts)
+        if self._count == slots:
+            self._pop_oldest()  # 満杯なら一番古いパケットを上書きする
+        slot = (self._head + self._count) % slots
+        self._pcm[slot, :len(chunk)] = chunk
+        self._starts[slot] = start
+        self._lengths[slot] = len(chunk)
+        self._speakers[slot] = speaker
+        self._count += 1
+
+    def _pop_oldest(self):
+        self._head = (self._head + 1) % len(self._starts)
+        self._count -= 1
+
+    @property
+    def packet_count(self) -> int:
+        return self._count
 
     def cleanup(self):
         # ライブラリが内部的に呼ぶため、バッファはクリアしない
         # （BOTの音声再生時にreader._stopから呼ばれる）
         pass
 
-    def get_audio_bytes(self):
-        """バッファ内の全PCMデータを結合してbytesとして返す（自然な間隔を維持）"""
-        if not self._buffer:
-            return b''
-            
-        result = bytearray()
-        last_time = None
-        # 0.5秒の無音データ (48000Hz * 2ch * 2byte * 0.5s = 96000 bytes)
-        silence_burst = b'\x00' * 96000
-        
-        for t, d in self._buffer:
-            if last_time is not None:
-                gap = t - last_time
-                if gap > 1.0:
-                    # 発言の間隔が1秒以上空いた場合、0.5秒の無音を挟む（STT用の区切り）
-                    result.extend(silence_burst)
-            result.extend(d)
-            # data.pcmの長さから音声の継続時間(秒)を計算
-            duration = len(d) / (48000 * 2 * 2)
-            last_time = t + duration
-            
-        return bytes(result)
+    def _mixdown(self) -> np.ndarray:
+        """全員の音声を再生位置に合わせて1本に重ねる（[サンプル数, 2] のint16）
+
+        誰も話していない時間が VOICE_GAP_MAX_SECONDS より長い所は VOICE_GAP_KEEP_SECONDS に詰める。
+        self._lock を持って呼ぶこと。
+        """
+        if not self._count:
+            return np.zeros((0, 2), dtype=np.int16)
+        order = (self._head + np.arange(self._count)) % len(self._starts)
+        starts = self._starts[order]
+        lengths = self._lengths[order]
+        speakers = self._speakers[order]
+
+        # 誰かが話している区間の切れ目を探し、長い無音を詰めた後の位置を求める
+        by_time = np.argsort(starts, kind="stable")
+        sorted_starts = starts[by_time]
+        covered = np.maximum.accumulate(sorted_starts + lengths[by_time])
+        gaps = sorted_starts[1:] - covered[:-1]
+        shrink = np.where(gaps > VOICE_GAP_MAX_SECONDS * DISCORD_SAMPLE_RATE,
+                          gaps - int(VOICE_GAP_KEEP_SECONDS * DISCORD_SAMPLE_RATE), 0)
+        positions = np.empty_like(starts)
+        positions[by_time] = sorted_starts - sorted_starts[0] - np.concatenate(([0], np.cumsum(shrink)))
+
+        mixed = np.zeros((int((positions + lengths).max()), 2), dtype=np.int16)
+        frame = np.arange(DISCORD_FRAME_SAMPLES)
+        for speaker in np.unique(speakers):
+            # 同じ人の続けて置いたパケット（1回の発言）は1つの区間としてまとめて足し込む
+            mine = np.flatnonzero(speakers == speaker)
+            ends = positions[mine] + lengths[mine]
+            for run in np.split(mine, np.flatnonzero(positions[mine[1:]] != ends[:-1]) + 1):
+                rows = self._pcm[order[run]]
+                if (lengths[run] == DISCORD_FRAME_SAMPLES).all():
+                    pcm = rows.reshape(-1, 2)
+                else:
+                    pcm = rows[frame < lengths[run][:, None]]  # 半端なパケットは有効な部分だけ
+                target = mixed[positions[run[0]]:positions[run[0]] + len(pcm)]
+                target[:] = np.clip(target.astype(np.int32) + pcm, -32768, 32767)
+        return mixed
+
+    def mixdown(self) -> np.ndarray:
+        """バッファ内の全員の音声を時刻を揃えて重ねた配列（[サンプル数, 2] のint16、48kHz）"""
+        with self._lock:
+            return self._mixdown()
 
     def clear(self):
         """明示的にバッファをクリアする（stop_rolling_bufferから呼ぶ用）"""
-        self._buffer.clear()
-        self._write_count = 0
-
-        self._buffer.clear()
+        with self._lock:
+            self._head = 0
+            self._count = 0
+            self._speaker_ids.clear()
+            self._next_start.clear()
         self._write_count = 0
 
 def start_rolling_buffer(vc):
@@ -490,6 +2012,118 @@ def stop_rolling_buffer(vc):
         
     print("🎙️ ローリングバッファ録音停止")
 
+# ==========================================
+# STT AUDIO（文字起こし用の音声変換）
+# ==========================================
+STT_SAMPLE_RATE = 16000  # 音声認識に送る音声のサンプリングレート（モノラル）
+STT_FILTER_TAPS = 16     # 間引き前のローパスフィルタの1位相あたりのタップ数
+_stt_filters = {}        # {間引き率: 位相ごとに分けたフィルタ係数[間引き率, タップ数]}
+
+def _stt_lowpass(factor: int) -> np.ndarray:
+    """1/factor に間引く前のローパスフィルタ（窓付きsinc）を位相ごとに並べ替えて返す"""
+    phases = _stt_filters.get(factor)
+    if phases is None:
+        n = STT_FILTER_TAPS * factor
+        t = np.arange(n) - (n - 1) / 2
+        cutoff = 0.45 / factor  # 間引き後のナイキスト周波数の9割
+        taps = 2 * cutoff * np.sinc(2 * cutoff * t) * np.blackman(n)
+        taps /= taps.sum()
+        # taps[p * factor + k] を phases[k, p] に置く
+        phases = taps.reshape(STT_FILTER_TAPS, factor).T.astype(np.float32)
+        _stt_filters[factor] = phases
+    return phases
+
+def resample_for_stt(samples: np.ndarray, rate: int) -> np.ndarray:
+    """PCM[フレーム数, ch] をモノラルにまとめて STT_SAMPLE_RATE に変換する（int16の1次元配列）
+
+    整数比ならポリフェーズで間引き（捨てるサンプルのフィルタ計算をしない）、そうでなければ線形補間。
+    """
+    mono = samples.reshape(len(samples), -1).astype(np.float32).mean(axis=1)
+    if rate == STT_SAMPLE_RATE:
+        out = mono
+    elif rate > STT_SAMPLE_RATE and rate % STT_SAMPLE_RATE == 0:
+        factor = rate // STT_SAMPLE_RATE
+        phases = _stt_lowpass(factor)
+        length = len(mono) // factor
+        # 位相 k の入力は x[m * factor - k]（先頭は0埋め）。位相ごとに短いフィルタを畳み込んで足す
+        padded = np.concatenate((np.zeros(factor - 1, dtype=np.float32), mono))
+        out = np.zeros(length, dtype=np.float32)
+        for k in range(factor):
+            out += np.convolve(padded[factor - 1 - k::factor][:length], phases[k])[:length]
+    else:
+        t = np.arange(int(len(mono) * STT_SAMPLE_RATE / rate)) * (rate / STT_SAMPLE_RATE)
+        out = np.interp(t, np.arange(len(mono)), mono)
+    return np.clip(out, -32768, 32767).astype(np.int16)
+
+STT_OPUS_BITRATE = 24     # kbps（音声認識には十分、WAVの約1/10）
+OPUS_PRE_SKIP = 312       # libopusのエンコーダ遅延（48kHzのサンプル数）
+OGG_PAGE_PACKETS = 50     # 1ページに入れるパケット数（20ms × 50 = 1秒）
+
+def _ogg_crc_table() -> list[int]:
+    table = []
+    for i in range(256):
+        crc = i << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else (crc << 1)
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+_OGG_CRC_TABLE = _ogg_crc_table()
+
+def _ogg_page(packets: list[bytes], granule: int, serial: int, seq: int, flags: int = 0) -> bytes:
+    """Oggのページを1枚作る（パケットはページをまたがないこと）"""
+    lacing = bytearray()
+    for packet in packets:
+        lacing += b"\xff" * (len(packet) // 255) + bytes([len(packet) % 255])
+    header = struct.pack("<4sBBqIII", b"OggS", 0, flags, granule, serial, seq, 0) + bytes([len(lacing)]) + lacing
+    page = bytearray(header + b"".join(packets))
+    crc = 0
+    for byte in page:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _OGG_CRC_TABLE[(crc >> 24) ^ byte]
+    struct.pack_into("<I", page, 22, crc)
+    return bytes(page)
+
+def encode_ogg_opus(pcm: np.ndarray, rate: int) -> bytes:
+    """モノラルPCM（int16の1次元配列）をOgg Opusにする（executorで実行する）
+
+    discord.pyのエンコーダは48kHzステレオ入力なので、各サンプルを並べて48kHzにし左右に複製する。
+    帯域はwideband（8kHzまで）に絞るので、引き伸ばしで出る高域はエンコーダ側で落ちる。
+    """
+    encoder = discord.opus.Encoder(application="voip", bitrate=STT_OPUS_BITRATE, fec=False,
+                                   bandwidth="wide", signal_type="voice")
+    stretch = DISCORD_SAMPLE_RATE // rate
+    step = DISCORD_FRAME_SAMPLES // stretch  # 1フレームに入る元のサンプル数
+    frames = -(-len(pcm) // step)
+    padded = np.zeros(frames * step, dtype=np.int16)
+    padded[:len(pcm)] = pcm
+    stereo = np.repeat(padded, stretch * 2).reshape(frames, DISCORD_FRAME_SAMPLES * 2)
+
+    serial = random.getrandbits(32)
+    head = struct.pack("<8sBBHIhB", b"OpusHead", 1, 2, OPUS_PRE_SKIP, rate, 0, 0)
+    vendor = b"mochigami"
+    tags = struct.pack("<8sI", b"OpusTags", len(vendor)) + vendor + struct.pack("<I", 0)
+    pages = [_ogg_page([head], 0, serial, 0, flags=0x02), _ogg_page([tags], 0, serial, 1)]
+    total = OPUS_PRE_SKIP + len(pcm) * stretch  # 最後のページのgranuleで末尾の0埋めを切る
+    for first in range(0, frames, OGG_PAGE_PACKETS):
+        last = min(first + OGG_PAGE_PACKETS, frames)
+        packets = [encoder.encode(stereo[i].tobytes(), DISCORD_FRAME_SAMPLES) for i in range(first, last)]
+        granule = min(OPUS_PRE_SKIP + last * DISCORD_FRAME_SAMPLES, total)
+        pages.append(_ogg_page(packets, granule, serial, len(pages), flags=0x04 if last == frames else 0))
+    return b"".join(pages)
+
+def prepare_stt_audio(samples: np.ndarray, rate: int) -> tuple[bytes, str]:
+    """録音したPCMを音声認識に送る形にする（データ, MIMEタイプ）。重いのでexecutorで呼ぶ
+
+    16kHzモノラルにしてからOgg Opusに圧縮する。libopusが使えなければWAVのまま送る。
+    """
+    pcm = resample_for_stt(samples, rate)
+    if len(pcm):
+        try:
+            return encode_ogg_opus(pcm, STT_SAMPLE_RATE), "audio/ogg"
+        except (discord.opus.OpusNotLoaded, discord.opus.OpusError) as e:
+            print(f"⚠️ Opusエンコード失敗のためWAVで送ります: {e!r}")
+    return build_wav(pcm, STT_SAMPLE_RATE), "audio/wav"
+
 # ==========================================
 # TASKS
 # ==========================================
@@ -584,37 +2218,34 @@ async def voice_chat_monitor_task():
 
         rolling_sink = state["rolling_sink"]
         # バッファからPCMデータを取得
-        if rolling_sink is None or not rolling_sink._buffer:
+        if rolling_sink is None or not rolling_sink.packet_count:
             print("⚠️ バッファが空のため相槌をスキップ")
             state["voice_last_audio_time"] = now  # リセットして再検知
             continue
 
-        pcm_data = rolling_sink.get_audio_bytes()
+        # バッファを重ねて16kHzモノラルのOgg Opusにする（20MB以上扱うのでイベントループの外で行う）
+        stt_started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        mixed = await loop.run_in_executor(None, rolling_sink.mixdown)
 
         # バッファ停止 & クールダウン開始
         stop_rolling_buffer(vc)
         state["voice_last_triggered"] = now
         state["voice_last_audio_time"] = None
 
-        if len(pcm_data) < 1000:
+        if len(mixed) < 250:
             print("⚠️ 音声データが少なすぎるためフォールバック")
             await _voice_chat_fallback(channel)
             continue
-
-        # PCMデータをWAV形式に変換
-        wav_buffer = io.BytesIO()
-        with wave.open(wav_buffer, 'wb') as wf:
-            wf.setnchannels(2)       # ステレオ
-            wf.setsampwidth(2)       # 16bit
-            wf.setframerate(48000)   # 48kHz (Discordの標準)
-            wf.writeframes(pcm_data)
-        wav_bytes = wav_buffer.getvalue()
+        stt_data, stt_mime = await loop.run_in_executor(None, prepare_stt_audio, mixed, DISCORD_SAMPLE_RATE)
+        print(f"🎧 STT音声: {mixed.nbytes // 1024}KB → {len(stt_data) // 1024}KB "
+              f"({stt_mime}, {time.perf_counter() - stt_started:.2f}秒)")
 
         # === Gemini STTで文字起こし ===
         try:
             audio_part = types.Part.from_bytes(
-                data=wav_bytes,
-                mime_type="audio/wav"
+                data=stt_data,
+                mime_type=stt_mime
             )
             stt_response = await client.aio.models.generate_content(
                 model=MODEL_NAME,
@@ -623,7 +2254,7 @@ async def voice_chat_monitor_task():
             )
             log_token_usage(stt_response, "VoiceChatSTT")
             transcribed_text = stt_response.text.strip()
-            print(f"📝 STT結果: {transcribed_text}", flush=True)
+            print(f"📝 STT結果 ({time.perf_counter() - stt_started:.2f}秒): {transcribed_text}", flush=True)
         except Exception as e:
             print(f"⚠️ 会話検知STTエラー: {e}")
             await _voice_chat_fallback(channel)
@@ -663,10 +2294,8 @@ async def voice_chat_monitor_task():
         # === テキスト投稿 + VOICEVOX読み上げ ===
         try:
             await channel.send(f"💬 {aizuchi_text}")
-            if not state["is_playing_music"]:
-                audio_data = await generate_wav(aizuchi_text, SPEAKER_ID)
-                if audio_data:
-                    play_audio(channel.guild, audio_data)
+            if not tts_blocked_by_music(state):
+                queue_tts(channel.guild, aizuchi_text, SPEAKER_ID, TTS_PRIORITY_RESPONSE)
         except Exception as e:
             print(f"⚠️ 相槌送信エラー: {e}")
 
@@ -681,10 +2310,8 @@ async def _voice_chat_fallback(channel):
         log_token_usage(response, "VoiceChatFallback")
         text = response.text.strip()
         await channel.send(text)
-        if not state["is_playing_music"]:
-            audio_data = await generate_wav(text, SPEAKER_ID)
-            if audio_data:
-                play_audio(channel.guild, audio_data)
+        if not tts_blocked_by_music(state):
+            queue_tts(channel.guild, text, SPEAKER_ID, TTS_PRIORITY_GREETING)
     except Exception as e:
         print(f"⚠️ フォールバック独り言エラー: {e}")
 
@@ -710,8 +2337,7 @@ async def random_monologue_task():
             log_token_usage(response, "Monologue")
             text = response.text.strip()
             await channel.send(text)
-            audio_data = await generate_wav(text, SPEAKER_ID)
-            if audio_data: play_audio(channel.guild, audio_data)
+            queue_tts(channel.guild, text, SPEAKER_ID, TTS_PRIORITY_GREETING)
         except Exception as e: print(f"⚠️ エラー: {e}")
 
 @tasks.loop(minutes=30)
@@ -736,8 +2362,7 @@ async def gohan_police_task():
             
             full_text = f"🚨 ごはん警察じゃ。{response.text.strip()}"
             await channel.send(full_text)
-            audio_data = await generate_wav(full_text, SPEAKER_ID)
-            if audio_data: play_audio(channel.guild, audio_data)
+            queue_tts(channel.guild, full_text, SPEAKER_ID, TTS_PRIORITY_GREETING)
         except Exception as e:
             print(f"Police Error: {e}")
 
@@ -751,12 +2376,19 @@ async def on_ready():
     global SPEAKER_ID
     print(f'【降臨】{bot.user} (Model: {MODEL_NAME})')
     
-    # VOICEVOXから話者一覧を取得
-    await fetch_speakers()
+    # 保存済みの話者一覧をすぐ使えるようにし、VOICEVOXへの確認はバックグラウンドで行う
+    load_speaker_catalog()
+    if not tts_router.fallback.available:
+        print("ℹ️ pyopenjtalk が未インストールのため、VOICEVOXが落ちているときの予備の読み上げは無効です")
+    await voicevox_pool.health_check()
+    if not voicevox_health_task.is_running(): voicevox_health_task.start()
     
     # 設定ファイルの読み込み
     load_bot_config()
     load_user_voices()
+
+    # 話者一覧の確認が済んだら、よく使う定型文をバックグラウンドで合成しておく（fetch_speakers から開始）
+    if not speaker_catalog_task.is_running(): speaker_catalog_task.start()
     
     # スラッシュコマンドの同期（二重表示防止のためグローバルに一本化）
     try:
@@ -773,7 +2405,6 @@ async def on_ready():
         print(f"⚠️ スラッシュコマンド同期失敗: {e}")
     
     if not random_monologue_task.is_running(): random_monologue_task.start()
-    if not tts_queue_worker.is_running(): tts_queue_worker.start()
 
 # ==========================================
 # SLASH COMMANDS (マイボイス・もちボイス)
@@ -794,6 +2425,7 @@ async def apply_voice(interaction: discord.Interaction, mode: str, char_name: st
     else:  # botvoice
         SPEAKER_ID = style_id
         save_bot_config()
+        start_tts_prewarm()
         await interaction.response.edit_message(
             content=f"✅ もち神さまの声を **{full_name}** に変更したのじゃ！",
             view=None
@@ -802,10 +2434,8 @@ async def apply_voice(interaction: discord.Interaction, mode: str, char_name: st
         guild = interaction.guild
         if guild and guild.voice_client:
             state = get_guild_state(guild.id)
-            if not state["is_playing_music"]:
-                audio_data = await generate_wav("声を変えたのじゃ！", SPEAKER_ID)
-                if audio_data:
-                    play_audio(guild, audio_data)
+            if not tts_blocked_by_music(state):
+                queue_tts(guild, "声を変えたのじゃ！", SPEAKER_ID, TTS_PRIORITY_RESPONSE)
 
 class CharacterSelectView(discord.ui.View):
     """キャラクター選択の1段階目ビュー（ページング対応）"""
@@ -910,6 +2540,15 @@ class StyleSelectView(discord.ui.View):
         )
         select.callback = self.style_selected
         self.add_item(select)
+
+        # 試聴（設定は変えずにサンプル音声だけ送る）
+        preview = discord.ui.Select(
+            placeholder="🔊 声を試聴する",
+            options=[discord.SelectOption(label=o.label, value=o.value) for o in options],
+            custom_id=f"style_preview_{mode}"
+        )
+        preview.callback = self.preview_selected
+        self.add_item(preview)
         
         # 戻るボタン
         back_btn = discord.ui.Button(label="◀ キャラ選択に戻る", style=discord.ButtonStyle.secondary)
@@ -927,6 +2566,25 @@ class StyleSelectView(discord.ui.View):
         
         await apply_voice(interaction, self.mode, self.char_name, style_name, style_id)
     
+    async def preview_selected(self, interaction: discord.Interaction):
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("これは他の人のメニューじゃ。", ephemeral=True)
+            return
+
+        style_id = int(interaction.data['values'][0])
+        style_name = next((s['name'] for s in self.styles if s['id'] == style_id), "不明")
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        # 事前合成済みならディスクキャッシュから返る（なければ応答と同じ優先度で合成する）
+        audio = await generate_wav(VOICE_PREVIEW_TEXT, style_id, TTS_PRIORITY_RESPONSE)
+        if audio is None or audio.fallback:
+            await interaction.followup.send("⚠️ VOICEVOXが応答せぬ。少し待つのじゃ。", ephemeral=True)
+            return
+        await interaction.followup.send(
+            f"🔊 **{self.char_name} / {style_name}** の声じゃ。",
+            file=discord.File(io.BytesIO(audio.getbuffer()), filename=f"preview_{style_id}.wav"),
+            ephemeral=True
+        )
+
     async def go_back(self, interaction: discord.Interaction):
         if interaction.user.id != self.user_id:
             await interaction.response.send_message("これは他の人のメニューじゃ。", ephemeral=True)
@@ -1381,15 +3039,12 @@ class MusicSelectMenu(discord.ui.Select):
         title = entry.get("title", "不明な曲")
 
         try:
-            if vc.is_playing():
-                vc.stop()
-
             source = discord.PCMVolumeTransformer(discord.FFmpegPCMAudio(url, **ffmpeg_opts), volume=MUSIC_VOLUME)
 
             def after_playing(error):
                 state["is_playing_music"] = False
 
-            vc.play(source, after=after_playing)
+            play_music(vc, source, after_playing)
             state["is_playing_music"] = True
             await interaction.followup.send(f"🎵 **再生中**: {title} (音量: {int(MUSIC_VOLUME*100)}%)")
         except Exception as e:
@@ -1440,11 +3095,10 @@ class MusicPlayModal(discord.ui.Modal, title="音楽を再生する"):
                     data = data['entries'][0]
                 url = data['url']
                 title = data.get('title', '不明な曲')
-                if vc.is_playing(): vc.stop()
                 source = discord.PCMVolumeTransformer(discord.FFmpegPCMAudio(url, **ffmpeg_opts), volume=MUSIC_VOLUME)
                 def after_playing(error):
                     state["is_playing_music"] = False
-                vc.play(source, after=after_playing)
+                play_music(vc, source, after_playing)
                 state["is_playing_music"] = True
                 await msg.edit(content=f"🎵 **再生中**: {title} (音量: {int(MUSIC_VOLUME*100)}%)")
             except Exception as e:
@@ -1530,9 +3184,9 @@ class MochimochiModal(discord.ui.Modal, title="もちもちに話しかける"):
                 # 自分以外のみんなに見えるように、channel.send()を使用する
                 await channel.send(f"💬 **{interaction.user.display_name}**：{user_question}\n\n{ai_text}")
                 
-                if not use_search and not state["is_playing_music"]:
-                    audio_data = await generate_wav(ai_text, SPEAKER_ID)
-                    if audio_data: play_audio(interaction.guild, audio_data)
+                if not tts_blocked_by_music(state):
+                    # 検索結果は長いので文ごとに分けて読み上げる
+                    queue_tts(interaction.guild, ai_text, SPEAKER_ID, TTS_PRIORITY_RESPONSE, chunked=use_search)
                     
                 await interaction.edit_original_response(content="✅ 送信したのじゃ。")
             except Exception as e:
@@ -1585,7 +3239,7 @@ class MainMenuSelect(discord.ui.Select):
             await interaction.response.send_modal(VolumeModal())
         elif val == "stop":
             if vc and vc.is_playing():
-                vc.stop()
+                stop_music(vc)
                 state["is_playing_music"] = False
                 await interaction.response.send_message("操作を受け付けたぞ。", ephemeral=True)
                 await interaction.channel.send("🛑 音楽を止めたぞ。")
@@ -1816,13 +3470,25 @@ async def slash_mochimochi_listen(interaction: discord.Interaction):
         # === Gemini APIで文字起こし ===
         try:
             # 音声ファイルをバイナリで読み込み
+            stt_started = time.perf_counter()
             with open(wav_filename, 'rb') as f:
                 audio_data = f.read()
 
+            # 16kHzモノラルのOgg Opusに変換してから送る（読めない形式ならそのまま送る）
+            try:
+                samples, rate = parse_wav(audio_data)
+                stt_data, stt_mime = await asyncio.get_running_loop().run_in_executor(
+                    None, prepare_stt_audio, samples, rate)
+            except ValueError as e:
+                print(f"⚠️ 録音WAVを変換できないためそのまま送ります: {e}")
+                stt_data, stt_mime = audio_data, "audio/wav"
+            print(f"🎧 STT音声: {len(audio_data) // 1024}KB → {len(stt_data) // 1024}KB "
+                  f"({stt_mime}, {time.perf_counter() - stt_started:.2f}秒)")
+
             # Gemini APIに音声を送信して文字起こし
             audio_part = types.Part.from_bytes(
-                data=audio_data,
-                mime_type="audio/wav"
+                data=stt_data,
+                mime_type=stt_mime
             )
 
             stt_response = await client.aio.models.generate_content(
@@ -1833,7 +3499,7 @@ async def slash_mochimochi_listen(interaction: discord.Interaction):
             log_token_usage(stt_response, "STT")
 
             transcribed_text = stt_response.text.strip()
-            print(f"📝 STT結果: {transcribed_text}", flush=True)
+            print(f"📝 STT結果 ({time.perf_counter() - stt_started:.2f}秒): {transcribed_text}", flush=True)
 
             if not transcribed_text or "聞き取れなかった" in transcribed_text:
                 await interaction.followup.send("🔇 聞き取れなかったのじゃ。もう少しはっきり話すのじゃ。")
@@ -1865,10 +3531,9 @@ async def slash_mochimochi_listen(interaction: discord.Interaction):
             print(f"🤖 [/もちもち] AI回答: {ai_text}", flush=True)
             await interaction.followup.send(ai_text)
 
-            # 読み上げ（検索結果でなければ）
-            if not use_search and not state["is_playing_music"]:
-                audio_data = await generate_wav(ai_text, SPEAKER_ID)
-                if audio_data: play_audio(interaction.guild, audio_data)
+            # 読み上げ（検索結果は長いので文ごとに分けて読み上げる）
+            if not tts_blocked_by_music(state):
+                queue_tts(interaction.guild, ai_text, SPEAKER_ID, TTS_PRIORITY_RESPONSE, chunked=use_search)
 
         except Exception as e:
             print(f"Listen STT/Chat Error: {e}")
@@ -1935,11 +3600,10 @@ async def slash_play(interaction: discord.Interaction, query: str):
                 data = data['entries'][0]
             url = data['url']
             title = data.get('title', '不明な曲')
-            if vc.is_playing(): vc.stop()
             source = discord.PCMVolumeTransformer(discord.FFmpegPCMAudio(url, **ffmpeg_opts), volume=MUSIC_VOLUME)
             def after_playing(error):
                 state["is_playing_music"] = False
-            vc.play(source, after=after_playing)
+            play_music(vc, source, after_playing)
             state["is_playing_music"] = True
             await msg.edit(content=f"🎵 **再生中**: {title} (音量: {int(MUSIC_VOLUME*100)}%)")
         except Exception as e:
@@ -1967,13 +3631,78 @@ async def slash_stop(interaction: discord.Interaction):
     state = get_guild_state(interaction.guild_id)
     vc = interaction.guild.voice_client if interaction.guild else None
     if vc and vc.is_playing():
-        vc.stop()
+        stop_music(vc)
         state["is_playing_music"] = False
         await interaction.response.send_message("止めたぞ。", ephemeral=True)
         await interaction.channel.send("🛑 音楽を止めたぞ。")
     else:
         await interaction.response.send_message("何も流れておらぬ。", ephemeral=True)
 
+@bot.tree.command(name="skip", description="今の読み上げを飛ばすのじゃ")
+async def slash_skip(interaction: discord.Interaction):
+    state = get_guild_state(interaction.guild_id)
+    vc = interaction.guild.voice_client if interaction.guild else None
+    if vc and state["tts_playing"]:
+        stop_tts_playback(vc)
+        state["tts_stats"]["skipped"] += 1
+        await interaction.response.send_message("⏭️ 読み上げを飛ばしたぞ。", ephemeral=True)
+    else:
+        await interaction.response.send_message("何も読み上げておらぬ。", ephemeral=True)
+
+@bot.tree.command(name="flush", description="溜まった読み上げを全部捨てるのじゃ")
+async def slash_flush(interaction: discord.Interaction):
+    dropped = flush_tts(interaction.guild_id)
+    await interaction.response.send_message(f"🧹 読み上げを **{dropped}件** 捨てたぞ。", ephemeral=True)
+
+@bot.tree.command(name="ttsstats", description="読み上げの統計を表示するのじゃ")
+async def slash_ttsstats(interaction: discord.Interaction):
+    state = get_guild_state(interaction.guild_id)
+    stats = state["tts_stats"]
+    lines = [
+        "📊 **読み上げ統計**",
+        f"メモリキャッシュ: {tts_cache.summary()}",
+        f"ディスクキャッシュ: {tts_disk_cache.summary()}",
+        f"Opusキャッシュ: {tts_opus_cache.summary()}",
+        f"VOICEVOX待ち: {voicevox_scheduler.summary()}",
+        f"合成時間: {format_wait_stats(tts_router.latency_stats)}",
+        f"キュー: 未再生 {state['tts_backlog']}件 / 破棄 {stats['dropped']}件 / 期限切れ {stats['expired']}件 / スキップ {stats['skipped']}件 / 割り込み {stats['preempted']}件",
+        f"再生までの待ち: {format_wait_stats(state['tts_latency'])}",
+    ]
+    drain = state["tts_last_drain"]
+    if drain:
+        lines.append(f"前回のキュー解消: {drain['jobs']}件を {drain['elapsed']:.0f}秒で再生 (平均 x{drain['avg_speed']:.2f})")
+    for engine in voicevox_pool.engines:
+        status = "🟢" if engine.available else "🔴"
+        lines.append(f"{status} {engine.url}: 処理中 {engine.inflight}件 / 平均 {engine.mean_latency():.2f}秒")
+    await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
+@bot.tree.command(name="ttsbench", description="最近のチャットで読み上げの正規化効果を測るのじゃ")
+@app_commands.describe(limit="調べるメッセージ数（10〜1000）")
+async def slash_ttsbench(interaction: discord.Interaction, limit: int = 200):
+    if not 10 <= limit <= 1000:
+        await interaction.response.send_message("❌ 10～1000の整数を指定するのじゃ。", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True)
+    messages = [msg async for msg in interaction.channel.history(limit=limit)
+                if msg.content and not msg.author.bot and not msg.content.startswith("!")]
+    if not messages:
+        await interaction.followup.send("調べるメッセージがないのう。", ephemeral=True)
+        return
+    start = time.perf_counter()
+    normalized = [normalize_readout_text(msg) for msg in messages]
+    elapsed = time.perf_counter() - start
+    before = sum(len(msg.content) for msg in messages)
+    after = sum(len(text) for text in normalized)
+    changed = sum(1 for msg, text in zip(messages, normalized) if msg.content != text)
+    saved = before - after
+    await interaction.followup.send(
+        f"📏 **読み上げ正規化ベンチマーク** ({len(messages)}件)\n"
+        f"文字数: {before} → {after} (**{saved}文字 / {saved / max(before, 1):.0%} 削減**)\n"
+        f"変化したメッセージ: {changed}件 / 処理時間: 1件あたり {elapsed / len(messages) * 1e6:.0f}µs\n"
+        f"見積もり合成時間の削減: 約{saved * TTS_SECONDS_PER_CHAR:.0f}秒",
+        ephemeral=True
+    )
+
 @bot.tree.command(name="volume", description="音楽の音量を変更するのじゃ")
 @app_commands.describe(volume="音量（0〜80）")
 async def slash_volume(interaction: discord.Interaction, volume: int):
@@ -2021,17 +3750,21 @@ async def slash_leave(interaction: discord.Interaction):
     else:
         await interaction.response.send_message("わしはまだおらんぞ。", ephemeral=True)
 
+DICE_LOW_WORDS = ["床ペロ", "雑魚よのう", "寄生か？", "無能じゃ", "ゴミじゃの", "非力すぎ", "出直せ雑魚"]
+DICE_MID_WORDS = ["普通じゃ", "及第点じゃ", "凡夫じゃの", "無難じゃ", "まあまあ", "安泰じゃ", "悪くない"]
+DICE_HIGH_WORDS = ["良いぞ", "高めじゃ", "期待大", "さすが", "運が良い", "追い風", "上出来"]
+DICE_SUPER_WORDS = ["天才じゃ", "凄まじい", "豪運のう", "驚きじゃ", "最高じゃ", "神引き", "震える"]
+
+def dice_reaction_words(res: int) -> list[str]:
+    """出目に応じたリアクション候補を返す"""
+    if res <= 35: return DICE_LOW_WORDS
+    elif 36 <= res <= 70: return DICE_MID_WORDS
+    elif 71 <= res <= 90: return DICE_HIGH_WORDS
+    else: return DICE_SUPER_WORDS
+
 def roll_dice(num: int) -> tuple[int, str]:
     res = random.randint(1, num)
-    low_words = ["床ペロ", "雑魚よのう", "寄生か？", "無能じゃ", "ゴミじゃの", "非力すぎ", "出直せ雑魚"]
-    mid_words = ["普通じゃ", "及第点じゃ", "凡夫じゃの", "無難じゃ", "まあまあ", "安泰じゃ", "悪くない"]
-    high_words = ["良いぞ", "高めじゃ", "期待大", "さすが", "運が良い", "追い風", "上出来"]
-    super_words = ["天才じゃ", "凄まじい", "豪運のう", "驚きじゃ", "最高じゃ", "神引き", "震える"]
-
-    if res <= 35: reaction = random.choice(low_words)
-    elif 36 <= res <= 70: reaction = random.choice(mid_words)
-    elif 71 <= res <= 90: reaction = random.choice(high_words)
-    else: reaction = random.choice(super_words)
+    reaction = random.choice(dice_reaction_words(res))
     return res, reaction
 
 async def summarize_dice(channel) -> str | None:
@@ -2065,9 +3798,8 @@ async def slash_dice(interaction: discord.Interaction, num: int = 100):
     await interaction.response.send_message(text)
     
     state = get_guild_state(interaction.guild_id)
-    if not state["is_playing_music"]:
-        audio_data = await generate_wav(f"{res}。{reaction}。", SPEAKER_ID)
-        if audio_data: play_audio(interaction.guild, audio_data)
+    if not tts_blocked_by_music(state):
+        queue_tts(interaction.guild, f"{res}。{reaction}。", SPEAKER_ID, TTS_PRIORITY_GAME)
 
 @bot.tree.command(name="diceresult", description="直近10分のダイス結果を集計するのじゃ")
 async def slash_diceresult(interaction: discord.Interaction):
@@ -2080,11 +3812,10 @@ async def slash_diceresult(interaction: discord.Interaction):
         await interaction.followup.send(result_text)
         
         state = get_guild_state(interaction.guild_id)
-        if not state["is_playing_music"]:
+        if not tts_blocked_by_music(state):
             lines = result_text.strip().splitlines()
             last_line = lines[-1] if lines else "集計完了じゃ。"
-            audio_data = await generate_wav(last_line, SPEAKER_ID)
-            if audio_data: play_audio(interaction.guild, audio_data)
+            queue_tts(interaction.guild, last_line, SPEAKER_ID, TTS_PRIORITY_GAME)
     except Exception as e:
         print(e)
         await interaction.followup.send("帳簿が開けぬ。")
@@ -2128,14 +3859,13 @@ async def play(ctx, *, query: str):
         url = data['url']
         title = data.get('title', '不明な曲')
         
-        if ctx.voice_client.is_playing(): ctx.voice_client.stop()
         
         source = discord.PCMVolumeTransformer(discord.FFmpegPCMAudio(url, **ffmpeg_opts), volume=MUSIC_VOLUME)
         
         def after_playing(error):
             state["is_playing_music"] = False
             
-        ctx.voice_client.play(source, after=after_playing)
+        play_music(ctx.voice_client, source, after_playing)
         state["is_playing_music"] = True
         
         await msg.edit(content=f"🎵 **再生中**: {title} (音量: {int(MUSIC_VOLUME*100)}%)")
@@ -2148,7 +3878,7 @@ async def play(ctx, *, query: str):
 async def stop(ctx):
     state = get_guild_state(ctx.guild.id)
     if ctx.voice_client and ctx.voice_client.is_playing():
-        ctx.voice_client.stop()
+        stop_music(ctx.voice_client)
         state["is_playing_music"] = False
         await ctx.send("止めたぞ。")
     else:
@@ -2197,8 +3927,7 @@ async def mjoin(ctx):
         )
         
         await ctx.send(greet + info_msg)
-        audio_data = await generate_wav(greet, SPEAKER_ID)
-        if audio_data: play_audio(ctx.guild, audio_data)
+        queue_tts(ctx.guild, greet, SPEAKER_ID, TTS_PRIORITY_GREETING)
 
 @bot.command()
 async def pause(ctx):
@@ -2231,6 +3960,10 @@ async def on_voice_state_update(member, before, after):
         state["voice_last_audio_time"] = None
         state["active_channel_id"] = None
         state["is_playing_music"] = False
+        stop_tts_worker(member.guild.id)
+        if state["greet_task"]:
+            state["greet_task"].cancel()
+        state["greet_pending"] = []
         if voice_chat_monitor_task.is_running():
             voice_chat_monitor_task.stop()
         return
@@ -2246,18 +3979,46 @@ async def on_voice_state_update(member, before, after):
             state["disconnect_task"].cancel()
         
         if state["active_channel_id"]:
-            text_ch = bot.get_channel(state["active_channel_id"])
-            if text_ch:
-                greet_text = f"{member.display_name}、いらっしゃいなのじゃ。"
-                await text_ch.send(greet_text)
-                if not state["is_playing_music"]:
-                    audio_data = await generate_wav(greet_text, SPEAKER_ID)
-                    if audio_data: play_audio(member.guild, audio_data)
+            # 続けて参加した人は GREET_COALESCE_WINDOW 秒ぶんまとめて挨拶する
+            if all(m.id != member.id for m in state["greet_pending"]):
+                state["greet_pending"].append(member)
+            if state["greet_task"] is None:
+                state["greet_task"] = asyncio.create_task(greet_joiners(member.guild))
 
     if len(bot_vc.channel.members) == 1:
         if not state["disconnect_task"] or state["disconnect_task"].done():
             state["disconnect_task"] = bot.loop.create_task(delayed_disconnect(bot_vc))
 
+GREET_COALESCE_WINDOW = 1.5  # VC参加の挨拶をまとめる待ち時間（秒）
+GREET_MAX_NAMES = 6          # 1回の挨拶で名前を呼ぶ最大人数
+
+def greeting_text(names: list[str]) -> str:
+    """VC参加者への挨拶文（1人なら事前合成・キャッシュと同じ文になる）"""
+    if len(names) > GREET_MAX_NAMES:
+        names = names[:GREET_MAX_NAMES - 1] + [f"ほか{len(names) - GREET_MAX_NAMES + 1}人"]
+    return f"{'、'.join(names)}、いらっしゃいなのじゃ。"
+
+async def greet_joiners(guild):
+    """少し待って、その間にVCへ来た人をまとめて1回で挨拶する"""
+    state = get_guild_state(guild.id)
+    try:
+        await asyncio.sleep(GREET_COALESCE_WINDOW)
+    finally:
+        state["greet_task"] = None
+    members, state["greet_pending"] = state["greet_pending"], []
+    vc = guild.voice_client
+    if vc is None or not state["active_channel_id"]:
+        return
+    # 待っている間に抜けた人は呼ばない
+    members = [m for m in members if m.voice and m.voice.channel == vc.channel]
+    text_ch = bot.get_channel(state["active_channel_id"])
+    if not members or not text_ch:
+        return
+    greet_text = greeting_text([m.display_name for m in members])
+    await text_ch.send(greet_text)
+    if not tts_blocked_by_music(state):
+        queue_tts(guild, greet_text, SPEAKER_ID, TTS_PRIORITY_GREETING)
+
 async def delayed_disconnect(voice_client):
     try:
         await asyncio.sleep(60) 
@@ -2328,9 +4089,8 @@ async def on_message(message):
         text = f"🔮 **{message.author.display_name}** の目は **【 {res} 】** じゃ！ 「{reaction}」"
         await message.channel.send(text)
         
-        if not state["is_playing_music"]:
-            audio_data = await generate_wav(f"{res}。{reaction}。", SPEAKER_ID)
-            if audio_data: play_audio(message.guild, audio_data)
+        if not tts_blocked_by_music(state):
+            queue_tts(message.guild, f"{res}。{reaction}。", SPEAKER_ID, TTS_PRIORITY_GAME)
         return
 
     # ■ ダイス結果集計 (プロンプト更新・インデント修正済み)
@@ -2343,12 +4103,11 @@ async def on_message(message):
                     return
                 await message.channel.send(result_text)
                 
-                if not state["is_playing_music"]:
+                if not tts_blocked_by_music(state):
                     # 最後の1行だけ読み上げ
                     lines = result_text.strip().splitlines()
                     last_line = lines[-1] if lines else "集計完了じゃ。"
-                    audio_data = await generate_wav(last_line, SPEAKER_ID)
-                    if audio_data: play_audio(message.guild, audio_data)
+                    queue_tts(message.guild, last_line, SPEAKER_ID, TTS_PRIORITY_GAME)
             except Exception as e:
                 print(e)
                 await message.channel.send("帳簿が開けぬ。")
@@ -2360,9 +4119,8 @@ async def on_message(message):
         
         if user_question == "ソーチョー":
             await message.channel.send("https://knt-a.com/fauxhollows/")
-            if not state["is_playing_music"]:
-                audio_data = await generate_wav("ソーチョー", SPEAKER_ID)
-                if audio_data: play_audio(message.guild, audio_data)
+            if not tts_blocked_by_music(state):
+                queue_tts(message.guild, "ソーチョー", SPEAKER_ID, TTS_PRIORITY_RESPONSE)
             return
 
         if len(user_question) > 50:
@@ -2380,19 +4138,20 @@ async def on_message(message):
                 log_token_usage(response, "Chat")
                 ai_text = response.text
                 await message.channel.send(ai_text)
-                if not use_search and not state["is_playing_music"]:
-                    audio_data = await generate_wav(ai_text, SPEAKER_ID)
-                    if audio_data: play_audio(message.guild, audio_data)
+                if not tts_blocked_by_music(state):
+                    # 検索結果は長いので文ごとに分けて読み上げる
+                    queue_tts(message.guild, ai_text, SPEAKER_ID, TTS_PRIORITY_RESPONSE, chunked=use_search)
             except Exception as e:
                 print(f"Error: {e}")
                 await message.channel.send("天界の網が乱れておるのう。")
         return
 
     if not message.content.startswith('!'):
-        if not state["is_playing_music"]:
-            user_speaker = get_user_speaker_id(str(message.author.id))
-            audio_data = await generate_wav(message.content, user_speaker)
-            if audio_data: play_audio(message.guild, audio_data)
+        if not tts_blocked_by_music(state):
+            text = normalize_readout_text(message)
+            if text:
+                user_speaker = get_user_speaker_id(str(message.author.id))
+                queue_readout(message.guild, text, user_speaker)
 
 # ==========================================
 # BOT STARTUP